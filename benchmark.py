@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from shutil import rmtree
+import make_from_full_package
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Parameters of the base case; the other cases change one or two of them
+BASE_CASE = {'tests': 50, 'test_size': 100 * 1024, 'testsets': 1, 'languages': 2}
+
+DEFAULT_CASES = [
+    {},
+    {'tests': 500, 'test_size': 1024},
+    {'tests': 10, 'test_size': 10 * 1024 * 1024},
+    {'testsets': 3},
+    {'languages': 5},
+]
+
+STATEMENT_LANGUAGES = ['portuguese', 'english', 'spanish', 'russian', 'french', 'german', 'italian', 'ukrainian']
+
+# Size of the random text the tests are cut from. Tests larger than this repeat it, but beyond the 32 KB window of
+# deflate, so they still compress like real tests.
+TEXT_POOL_SIZE = 4 * 1024 * 1024
+
+
+def make_text_pool(seed):
+    """Generates random test-like text: lines of numbers separated by spaces."""
+    rnd = random.Random(seed)
+    lines = []
+    size = 0
+    while size < TEXT_POOL_SIZE:
+        line = ' '.join(str(rnd.randint(0, 10 ** 9)) for _ in range(rnd.randint(1, 20))) + '\n'
+        lines.append(line)
+        size += len(line)
+    return ''.join(lines).encode()
+
+
+def make_test(pool, offset, size):
+    """Cuts a test of the given size from the text pool, starting at offset and wrapping around."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = pool[offset:offset + size - len(data)]
+        data += chunk
+        offset = 0
+    return bytes(data)
+
+
+def make_synthetic_package(path, tests, test_size, testsets, languages, seed=0):
+    """
+    Writes a synthetic Polygon Full package with the layout and file kinds of a real one.
+
+    Args:
+    path (str): The path of the zip file to write.
+    tests (int): Number of tests of each testset.
+    test_size (int): Size of each test input, in bytes.
+    testsets (int): Number of testsets.
+    languages (int): Number of statement languages, Portuguese first.
+    seed (int): Seed of the generated content.
+    """
+    rnd = random.Random(seed)
+    pool = make_text_pool(seed)
+    testset_names = ['tests'] + [f'tests{idx}' for idx in range(2, testsets + 1)]
+    statement_languages = STATEMENT_LANGUAGES[:languages]
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        testsets_xml = ''
+        for name in testset_names:
+            testsets_xml += f'''
+        <testset name="{name}">
+            <time-limit>1500</time-limit>
+            <memory-limit>268435456</memory-limit>
+            <test-count>{tests}</test-count>
+            <input-path-pattern>{name}/%02d</input-path-pattern>
+            <answer-path-pattern>{name}/%02d.a</answer-path-pattern>
+            <tests>{'<test method="generated"/>' * tests}</tests>
+        </testset>'''
+            for idx in range(1, tests + 1):
+                test_input = make_test(pool, rnd.randrange(len(pool)), test_size)
+                package.writestr(f'{name}/{idx:02d}', test_input)
+                package.writestr(f'{name}/{idx:02d}.a', make_test(pool, rnd.randrange(len(pool)), test_size // 10 + 1))
+
+        names_xml = ''.join(f'<name language="{language}" value="Synthetic problem"/>'
+                            for language in statement_languages)
+        package.writestr('problem.xml', f'''<?xml version="1.0" encoding="utf-8" standalone="no"?>
+<problem revision="1" short-name="synthetic">
+    <names>{names_xml}</names>
+    <judging cpu-name="Intel(R) Core(TM) i3-8100 CPU @ 3.60GHz" cpu-speed="3600" input-file="" output-file="">
+        {testsets_xml}
+    </judging>
+    <assets>
+        <checker name="std::wcmp.cpp" type="testlib">
+            <source path="files/check.cpp" type="cpp.g++17"/>
+        </checker>
+        <solutions>
+            <solution tag="main"><source path="solutions/main.cpp" type="cpp.g++17"/></solution>
+        </solutions>
+    </assets>
+</problem>
+''')
+        # testlib.h is about 200 KB in real packages
+        testlib = '#pragma once\n' + '// testlib\n' * 18000
+        package.writestr('files/testlib.h', testlib)
+        checker = '#include "testlib.h"\nint main(int argc, char* argv[]) { return 0; }\n'
+        package.writestr('check.cpp', checker)
+        package.writestr('files/check.cpp', checker)
+        package.writestr('files/gen.cpp', '#include "testlib.h"\nint main() { return 0; }\n')
+        package.writestr('solutions/main.cpp', 'int main() { return 0; }\n')
+        for language in statement_languages:
+            # PDFs are mostly compressed streams: random bytes
+            package.writestr(f'statements/.pdf/{language}/problem.pdf', rnd.randbytes(200 * 1024))
+            package.writestr(f'statements/.html/{language}/problem.html', make_test(pool, 0, 20 * 1024))
+            package.writestr(f'statements/{language}/problem.tex', make_test(pool, 0, 10 * 1024))
+
+
+def folder_size(folder):
+    """Returns the total size of the files in a folder, in bytes."""
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(folder) for file in files)
+
+
+def run_case(package, work_folder, repeat, options):
+    """
+    Builds a package repeat times in work_folder, measuring each build. Runs in its own process.
+
+    The first build starts from an empty folder; the next ones replace the previous package, so they include the
+    backup stage.
+
+    Returns:
+    dict: The measurements of each build and the peak resident memory of the process, in KB.
+    """
+    zip_file = os.path.join(work_folder, 'zip_packages', 'Problem_A.zip')
+    packages_folder = os.path.join(work_folder, 'packages', 'Problem_A')
+    runs = []
+    for _ in range(repeat):
+        metrics = {}
+        with redirect_stdout(io.StringIO()), make_from_full_package.measure_stage(metrics, 'total'):
+            make_from_full_package.make_problem('A', package, **options, folder=work_folder, metrics=metrics)
+        total = metrics.pop('total')
+        runs.append({
+            'total': total['wall'],
+            'cpu': total['cpu'],
+            'stages': metrics,
+            'bytes_written': total['bytes_written'],
+            'zip_size': os.path.getsize(zip_file),
+            'package_size': folder_size(packages_folder) if os.path.exists(packages_folder) else 0
+        })
+    result = {'runs': runs}
+    if resource is not None:  # the peak memory is left out where it is not available
+        result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['children_peak_rss_kb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return result
+
+
+def benchmark_case(case, temp_folder, repeat, options):
+    """
+    Generates the synthetic package of a case and benchmarks its build in a fresh process and work folder.
+
+    Returns:
+    dict: The case parameters, the generated package size and the measurements.
+    """
+    params = dict(BASE_CASE, **case)
+    case_name = '_'.join(f'{key}{value}' for key, value in params.items())
+    package = os.path.join(temp_folder, 'package_' + case_name + '.zip')
+    make_synthetic_package(package, **params)
+
+    work_folder = tempfile.mkdtemp(prefix='work_', dir=temp_folder)
+    result = {'params': params, 'package_size': os.path.getsize(package)}
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result.update(executor.submit(run_case, package, work_folder, repeat, options).result())
+    except make_from_full_package.PackageError as e:
+        result['error'] = f"build failed: {e}"
+    finally:
+        rmtree(work_folder, ignore_errors=True)
+        os.remove(package)
+    return result
+
+
+def parse_case(spec):
+    """Parses a case given as key=value pairs separated by commas, such as tests=500,test_size=1024."""
+    case = {}
+    for pair in spec.split(','):
+        key, value = pair.split('=')
+        if key not in BASE_CASE:
+            raise ValueError(f"Unknown case parameter '{key}', expected one of {', '.join(BASE_CASE)}.")
+        case[key] = int(value)
+    return case
+
+
+def git_revision():
+    """Returns the current git commit of the builder, or None outside a git checkout."""
+    script_folder = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=script_folder, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def print_results(results, baseline=None):
+    """Prints the stage times of each case, with the wall time ratio to the baseline results when given."""
+    baseline_cases = {json.dumps(case['params'], sort_keys=True): case for case in (baseline or {}).get('cases', [])}
+    for case in results['cases']:
+        params = ', '.join(f'{key}={value}' for key, value in case['params'].items())
+        print(f"\n{params} (package {case['package_size'] / 1024 ** 2:.1f} MB)")
+        if 'error' in case:
+            print("  " + case['error'])
+            continue
+        if 'peak_rss_kb' in case:
+            print(f"  peak RSS {case['peak_rss_kb'] / 1024:.1f} MB")
+        previous = baseline_cases.get(json.dumps(case['params'], sort_keys=True))
+        for idx, run in enumerate(case['runs']):
+            previous_run = previous['runs'][idx] if previous and idx < len(previous.get('runs', [])) else None
+            print(f"  build {idx + 1}: {run['total']:.3f} s ({run['cpu']:.3f} s CPU), "
+                  f"{(run['bytes_written'] or 0) / 1024 ** 2:.1f} MB written"
+                  + (f" ({run['total'] / previous_run['total']:.2f}x baseline)" if previous_run else ""))
+            for stage, counters in run['stages'].items():
+                ratio = ""
+                previous_stage = previous_run['stages'].get(stage) if previous_run else None
+                if isinstance(previous_stage, dict) and previous_stage['wall']:
+                    ratio = f" ({counters['wall'] / previous_stage['wall']:.2f}x baseline)"
+                print(f"    {stage:<26} {counters['wall']:.3f} s, {counters['files']:>5} files{ratio}")
+
+
+if __name__ == '__main__':
+    """
+    Benchmarks make_from_full_package on synthetic Polygon packages, generated offline.
+
+    Usage: python3 benchmark.py [--case key=value,...]... [--repeat N] [--output FILE] [--baseline FILE] [--recompress]
+                                [--compression-level N|store] [--threads N]
+
+    Each case is built in a fresh process and work folder, so the packages, zip_packages and backups folders of the
+    repository are not touched. The results are written as JSON (benchmark.json by default) and can be passed as
+    --baseline to a later run, to compare versions of the builder.
+    """
+    args = sys.argv[1:]
+    try:
+        repeat = make_from_full_package.pop_option(args, '--repeat', int) or 2
+        output = make_from_full_package.pop_option(args, '--output', str) or 'benchmark.json'
+        baseline_file = make_from_full_package.pop_option(args, '--baseline', str)
+        compression_level = make_from_full_package.pop_option(args, '--compression-level',
+                                                              make_from_full_package.parse_compression_level)
+        threads = make_from_full_package.pop_option(args, '--threads', int)
+        cases = []
+        case = make_from_full_package.pop_option(args, '--case', parse_case)
+        while case is not None:
+            cases.append(case)
+            case = make_from_full_package.pop_option(args, '--case', parse_case)
+    except ValueError as e:
+        sys.exit(f"Invalid option: {e}")
+    options = {'raw_copy': '--recompress' not in args, 'compression_level': compression_level, 'threads': threads}
+
+    baseline = None
+    if baseline_file:
+        with open(baseline_file) as file:
+            baseline = json.load(file)
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'options': options,
+        'cases': []
+    }
+    temp_folder = tempfile.mkdtemp(prefix='boca_benchmark_')
+    try:
+        for case in cases or DEFAULT_CASES:
+            print("Benchmarking", dict(BASE_CASE, **case), file=sys.stderr)
+            results['cases'].append(benchmark_case(case, temp_folder, repeat, options))
+    finally:
+        rmtree(temp_folder, ignore_errors=True)
+
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print_results(results, baseline)
+    print(f"\nResults written to {output}")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import errno
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from shutil import copy2
+
+# Size of the buffer files are hashed and written with
+BUFFER_SIZE = 1024 * 1024
+
+# Permissions of every blob. Hard links share them, so blobs are read-only: a file of a package or backup can not be
+# edited in place, which would change every other file linked to the same blob. Executable files are never stored.
+BLOB_MODE = 0o444
+
+# Folder of the store that blobs are written to before they are renamed to their digest
+TEMP_FOLDER = 'tmp'
+
+# Blobs linked, unlinked or created less than this many seconds ago are never collected, so a build that just added
+# a blob has time to link it
+GC_GRACE_SECONDS = 60 * 60
+
+
+def blob_path(store, digest):
+    """Returns the path of the blob with the given SHA-256 hex digest, in a subfolder named after its first byte."""
+    return os.path.join(store, digest[:2], digest[2:])
+
+
+def can_store(mode):
+    """Tells whether a file with the given permissions can be a link to a blob, that is, whether it is not executable."""
+    return not mode & 0o111
+
+
+def is_blob_link(file_stat):
+    """
+    Tells whether a file, given its os.stat result, is a link to a blob: blobs are read-only, and a file linked to
+    one has at least the blob itself as another link. Such a file can be linked again without being read.
+    """
+    return file_stat.st_mode & 0o777 == BLOB_MODE and file_stat.st_nlink > 1
+
+
+def add_stream(store, stream):
+    """
+    Adds the contents of a binary stream to the store, unless a blob with the same contents is already there.
+
+    The stream is hashed as it is written to a temporary file of the store, which is dropped when the blob already
+    exists, so each distinct content is written to disk only once.
+
+    Args:
+    store (str): The folder of the store.
+    stream (file): A binary file object, read to its end.
+
+    Returns:
+    str: The path of the blob.
+    """
+    temp_folder = os.path.join(store, TEMP_FOLDER)
+    os.makedirs(temp_folder, exist_ok=True)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=temp_folder, delete=False) as temp_file:
+        try:
+            for chunk in iter(lambda: stream.read(BUFFER_SIZE), b''):
+                digest.update(chunk)
+                temp_file.write(chunk)
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+    path = blob_path(store, digest.hexdigest())
+    if os.path.exists(path):
+        os.remove(temp_file.name)
+    else:
+        os.chmod(temp_file.name, BLOB_MODE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_file.name, path)  # another build adding the same blob at the same time writes the same bytes
+    return path
+
+
+def add_file(store, path):
+    """
+    Adds a file to the store, unless a blob with the same contents is already there.
+
+    The file is hashed first, so a file whose contents are already stored is only read. Otherwise it is copied into
+    the store with add_stream: a file that can be written to never becomes a blob itself, or editing it would change
+    the blob.
+
+    Returns:
+    str: The path of the blob, or None when the file is executable (see can_store).
+    """
+    if not can_store(os.stat(path).st_mode):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(BUFFER_SIZE), b''):
+            digest.update(chunk)
+        blob = blob_path(store, digest.hexdigest())
+        if not os.path.exists(blob):
+            file.seek(0)
+            blob = add_stream(store, file)
+    return blob
+
+
+def link_blob(blob, target):
+    """
+    Makes target a hard link to a blob, replacing any file already there. Falls back to a copy when the blob has
+    as many links as the file system allows, or is on another file system.
+    """
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(blob, target)
+    except OSError as e:
+        if e.errno not in (errno.EMLINK, errno.EXDEV, errno.EPERM):
+            raise
+        copy2(blob, target)
+
+
+def collect_garbage(store, grace_seconds=GC_GRACE_SECONDS):
+    """
+    Removes the blobs no package, backup or other file links to any more, that is, the blobs with a single link.
+
+    Args:
+    store (str): The folder of the store.
+    grace_seconds (int): Blobs whose links changed less than this many seconds ago are kept, as are temporary files
+    younger than that, so a build running at the same time does not lose a blob it just added.
+
+    Returns:
+    tuple: The number of blobs removed and the bytes freed.
+    """
+    removed = 0
+    freed = 0
+    newest_allowed = time.time() - grace_seconds
+    if not os.path.isdir(store):
+        return removed, freed
+    for entry in os.scandir(store):
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        for blob in os.scandir(entry.path):
+            blob_stat = blob.stat(follow_symlinks=False)
+            unreferenced = entry.name == TEMP_FOLDER or blob_stat.st_nlink == 1
+            # The change time moves when a link is added or removed
+            if unreferenced and blob_stat.st_ctime < newest_allowed:
+                try:
+                    os.remove(blob.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += blob_stat.st_size
+    return removed, freed
+
+
+def store_usage(store):
+    """
+    Returns the number of blobs of the store, the bytes they take, and the bytes the files linking to them would take
+    as separate copies.
+    """
+    blobs = 0
+    size = 0
+    linked_size = 0
+    for entry in os.scandir(store):
+        if entry.is_dir(follow_symlinks=False) and entry.name != TEMP_FOLDER:
+            for blob in os.scandir(entry.path):
+                blob_stat = blob.stat(follow_symlinks=False)
+                blobs += 1
+                size += blob_stat.st_size
+                linked_size += blob_stat.st_size * (blob_stat.st_nlink - 1)
+    return blobs, size, linked_size
+
+
+if __name__ == '__main__':
+    """
+    Reports the usage of a blob store and, with --gc, removes the blobs nothing links to any more.
+
+    Usage: python3 blob_store.py STORE [--gc] [--grace SECONDS]
+    """
+    args = sys.argv[1:]
+    grace = GC_GRACE_SECONDS
+    if '--grace' in args:
+        position = args.index('--grace')
+        try:
+            grace = int(args[position + 1])
+        except (IndexError, ValueError):
+            sys.exit("--grace expects a number of seconds")
+        del args[position:position + 2]
+    collect = '--gc' in args
+    args = [arg for arg in args if arg != '--gc']
+    if len(args) != 1:
+        sys.exit("Usage: python3 blob_store.py STORE [--gc] [--grace SECONDS]")
+    if not os.path.isdir(args[0]):
+        sys.exit(f"The directory {args[0]} does not exist")
+
+    if collect:
+        blobs_removed, bytes_freed = collect_garbage(args[0], grace)
+        print(f"Removed {blobs_removed} unreferenced blob(s), {bytes_freed / 1024 ** 2:.1f} MB freed")
+    blob_count, blob_size, copies_size = store_usage(args[0])
+    print(f"{blob_count} blob(s), {blob_size / 1024 ** 2:.1f} MB, linked as {copies_size / 1024 ** 2:.1f} MB of files")
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import xml.etree.ElementTree as eT
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from math import ceil
+import make_from_full_package
+
+# Tags of the Polygon solutions that must pass every test, and so are timed
+REFERENCE_TAGS = ('main', 'accepted')
+
+# Language of the limits files (see make_from_full_package.make_limits) of each prefix of a Polygon source type
+SOURCE_LANGUAGES = [('cpp.', 'cpp'), ('c.', 'c'), ('java', 'java'), ('kotlin', 'kt'), ('python.3', 'py3'),
+                    ('python.pypy3', 'py3')]
+
+# Commands that compile a solution, the same as the compile scripts of problem_template. {source} is the file name
+# of the solution and {name} the same name without its extension.
+COMPILE_COMMANDS = {
+    'c': ['gcc', '-static', '-O2', '-DONLINE_JUDGE', '-o', 'run.exe', '{source}', '-lm'],
+    'cpp': ['g++', '-static', '-O2', '-std=c++20', '-DONLINE_JUDGE', '-o', 'run.exe', '{source}', '-lm'],
+    'java': ['javac', '{source}'],
+    'kt': ['kotlinc', '-d', 'run.jar', '-include-runtime', '{source}'],
+}
+
+# Commands that run a compiled solution, the same as the run scripts of problem_template. {memory} is the memory
+# limit and {stack} a tenth of it, in KB.
+RUN_COMMANDS = {
+    'c': ['./run.exe'],
+    'cpp': ['./run.exe'],
+    'java': ['java', '-Xmx{memory}K', '-Xss{stack}K', '-Xms{memory}K', '{name}'],
+    'kt': ['kotlin', 'run.jar', '-J-Xmx{memory}K', '-J-Xss{stack}K', '-J-Xms{memory}K'],
+    'py3': ['python3', '{source}'],
+}
+
+# Languages whose run scripts limit the memory of the process itself; the JVM ones limit the heap with -Xmx instead
+MEMORY_LIMITED_LANGUAGES = ('c', 'cpp', 'py3')
+
+# Output size limit of the run scripts, in KB (the last value of the limits files)
+OUTPUT_LIMIT_KB = 15360
+
+# Solutions are timed with a CPU limit of this many times the C/C++ time limit, so the slow languages are measured
+# instead of just cut off. The run scripts also stop a run after 30 seconds more than that, of wall time.
+CPU_LIMIT_FACTOR = 10
+WALL_LIMIT_EXTRA = 30
+
+# Shortest C/C++ time the factors are computed against, in seconds, so a reference solution that runs in almost no
+# time does not turn the startup time of the JVM or of Python into a huge factor
+MIN_REFERENCE_TIME = 0.1
+
+# Factors are rounded up to this step, and never go below 1
+FACTOR_STEP = Fraction(1, 10)
+
+
+def solution_language(source_type):
+    """Returns the language of a Polygon source type, such as cpp.g++17 or java11, or None when BOCA can not run it."""
+    for prefix, language in SOURCE_LANGUAGES:
+        if source_type.startswith(prefix):
+            return language
+    return None
+
+
+def reference_solutions(xml_root):
+    """
+    Lists the solutions of problem.xml that must pass every test, in a language BOCA runs.
+
+    Returns:
+    list of tuple: The member name, language and tag of each solution.
+    """
+    solutions = []
+    for solution in xml_root.iter('solution'):
+        source = solution.find('source')
+        if source is None or solution.attrib.get('tag') not in REFERENCE_TAGS:
+            continue
+        language = solution_language(source.attrib.get('type', ''))
+        if language is not None:
+            solutions.append((source.attrib['path'], language, solution.attrib['tag']))
+    return solutions
+
+
+def compile_solution(polygon_zip, path, language, folder):
+    """
+    Extracts a solution to folder and compiles it.
+
+    Args:
+    polygon_zip (ZipFile): The opened polygon package.
+    path (str): The member name of the solution.
+    language (str): The language of the solution (see solution_language).
+    folder (str): An empty folder the solution is compiled and later run in.
+
+    Returns:
+    str: The compiler errors, or None when the solution compiled.
+    """
+    source = os.path.basename(path)
+    with polygon_zip.open(path) as member, open(os.path.join(folder, source), 'wb') as file:
+        shutil.copyfileobj(member, file)
+    if language not in COMPILE_COMMANDS:
+        return None
+    command = [part.format(source=source) for part in COMPILE_COMMANDS[language]]
+    try:
+        result = subprocess.run(command, cwd=folder, capture_output=True, text=True)
+    except FileNotFoundError:
+        return f"{command[0]} not found"
+    return (result.stderr or 'compilation failed') if result.returncode != 0 else None
+
+
+# Program run in front of each solution: it sets the resource limits safeexec sets for a run, reports the CPU time it
+# used itself through a pipe, so it is not counted as time of the solution, and replaces itself with the solution.
+# Setting the limits with preexec_fn instead would run Python code between fork and exec, which is not safe in the
+# threads of the worker pool. Its arguments are the CPU seconds, the output limit and memory limit in bytes (0 for no
+# memory limit), the pipe and the command of the solution.
+LIMIT_SHIM = """import os, resource, sys
+cpu_seconds, output_limit, memory_limit, report = map(int, sys.argv[1:5])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+resource.setrlimit(resource.RLIMIT_FSIZE, (output_limit, output_limit))
+if memory_limit:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+usage = resource.getrusage(resource.RUSAGE_SELF)
+os.write(report, str(usage.ru_utime + usage.ru_stime).encode())
+os.close(report)
+os.execvp(sys.argv[5], sys.argv[5:])
+"""
+
+
+def run_test(command, folder, input_file, cpu_seconds, memory_kb):
+    """
+    Runs a compiled solution on one test, with the CPU, memory and output limits of the run scripts.
+
+    Args:
+    command (list of str): The command that runs the solution.
+    folder (str): The folder of the compiled solution.
+    input_file (str): The path of the test input.
+    cpu_seconds (int): The CPU time limit of the run.
+    memory_kb (int): The memory limit of the process, or None to leave it unlimited.
+
+    Returns:
+    tuple: The CPU time of the run in seconds, and None when it finished normally or the reason it failed.
+    """
+    read_end, write_end = os.pipe()
+    limits = [cpu_seconds, OUTPUT_LIMIT_KB * 1024, (memory_kb or 0) * 1024, write_end]
+    with open(input_file, 'rb') as stdin, tempfile.TemporaryFile() as stdout, open(read_end, 'rb') as report:
+        try:
+            process = subprocess.Popen([sys.executable, '-S', '-c', LIMIT_SHIM, *map(str, limits), *command],
+                                       cwd=folder, stdin=stdin, stdout=stdout, stderr=subprocess.DEVNULL,
+                                       pass_fds=(write_end,))
+        finally:
+            os.close(write_end)
+        # The process is reaped here instead of by Popen.wait, since only wait4 gives its resource usage
+        timer = threading.Timer(cpu_seconds + WALL_LIMIT_EXTRA, os.kill, (process.pid, signal.SIGKILL))
+        timer.start()
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        finally:
+            timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        shim_time = float(report.read() or 0)
+
+    # The CPU limit counts the time of the shim too, but the time reported is only the time of the solution
+    limited_time = usage.ru_utime + usage.ru_stime
+    cpu_time = max(0.0, limited_time - shim_time)
+    if process.returncode == 0:
+        return cpu_time, None
+    if process.returncode in (-signal.SIGXCPU, -signal.SIGKILL) and limited_time >= cpu_seconds:
+        return cpu_time, "time limit exceeded"
+    if process.returncode == -signal.SIGKILL:
+        return cpu_time, "wall time limit exceeded"
+    if process.returncode < 0:
+        return cpu_time, f"killed by {signal.Signals(-process.returncode).name}"
+    return cpu_time, f"exit code {process.returncode}"
+
+
+def time_solutions(zip_file, jobs=None, log=print):
+    """
+    Compiles the reference solutions of a Polygon package and times them on every test.
+
+    Every test of every solution is a separate job of a worker pool, so jobs runs can be timed at the same time.
+
+    Args:
+    zip_file (str): The path of the Polygon package.
+    jobs (int): The number of runs at the same time. One per CPU by default.
+    log (callable): Receives the progress messages.
+
+    Returns:
+    tuple: The C/C++ time limit in seconds, its repetitions, and a list with the member name, language, tag and
+    results of each solution. The results are None when the solution did not compile, and otherwise a list of the
+    CPU time and failure (see run_test) of each test.
+    """
+    polygon_zip = make_from_full_package.open_polygon_package(zip_file)
+    with polygon_zip, tempfile.TemporaryDirectory(prefix='boca_calibrate_') as temp_folder:
+        with polygon_zip.open('problem.xml') as xml_file:
+            xml_root = eT.parse(xml_file).getroot()
+        clang_timelimit, repetitions, memory_limit = make_from_full_package.get_limits(xml_root)
+        solutions = reference_solutions(xml_root)
+        if not solutions:
+            raise make_from_full_package.PackageError("No main or accepted solution in C, C++, Java, Kotlin or "
+                                                      "Python 3 found in problem.xml.")
+
+        names = set(polygon_zip.namelist())
+        inputs = [input_name for testset in xml_root.find('judging').findall('testset')
+                  for input_name, _ in make_from_full_package.index_tests(testset, names)]
+        missing = [name for name in inputs if name not in names]
+        if missing:
+            raise make_from_full_package.PackageError(f"Test inputs missing from the package: {', '.join(missing)}.")
+        input_files = []
+        for idx, name in enumerate(inputs):
+            input_files.append(os.path.join(temp_folder, f'input{idx}'))
+            with polygon_zip.open(name) as member, open(input_files[-1], 'wb') as file:
+                shutil.copyfileobj(member, file)
+
+        memory_kb = memory_limit * 1000  # the run scripts take the megabytes of the limits files as thousands of KB
+        cpu_seconds = ceil(clang_timelimit / repetitions * CPU_LIMIT_FACTOR)
+        log(f"Compiling {len(solutions)} solution(s) and running them on {len(inputs)} test(s)...")
+        with ThreadPoolExecutor(jobs or os.cpu_count()) as executor:
+            folders = [tempfile.mkdtemp(prefix='solution', dir=temp_folder) for _ in solutions]
+            compiled = list(executor.map(lambda solution, folder: compile_solution(polygon_zip, *solution[:2], folder),
+                                         solutions, folders))
+            runs = []
+            for (path, language, _), folder, errors in zip(solutions, folders, compiled):
+                if errors is not None:
+                    log(f"{path} did not compile: {errors.strip()}")
+                    runs.append(None)
+                    continue
+                source = os.path.basename(path)
+                command = [part.format(source=source, name=os.path.splitext(source)[0], memory=memory_kb,
+                                       stack=memory_kb // 10) for part in RUN_COMMANDS[language]]
+                limit = memory_kb if language in MEMORY_LIMITED_LANGUAGES else None
+                runs.append([executor.submit(run_test, command, folder, input_file, cpu_seconds, limit)
+                             for input_file in input_files])
+            results = [None if futures is None else [future.result() for future in futures] for futures in runs]
+    return clang_timelimit, repetitions, [solution + (result,) for solution, result in zip(solutions, results)]
+
+
+def suggest_factors(solutions, margin):
+    """
+    Computes the Java and Python time limit factors from the times of the reference solutions.
+
+    The factor of a language is the ratio between the slowest test of its slowest solution and the slowest test of the
+    slowest C/C++ solution, times margin, rounded up to FACTOR_STEP and at least 1. Kotlin uses the Java factor.
+
+    Args:
+    solutions (list of tuple): The solutions and their results (see time_solutions).
+    margin (float): Extra room given to the slower languages, as a multiplier.
+
+    Returns:
+    dict: The JAVA_TL_FACTOR and PYTHON_TL_FACTOR that could be computed, as ints when whole.
+    """
+    slowest = {}
+    for _, language, _, results in solutions:
+        if results is not None:
+            slowest[language] = max([slowest.get(language, 0)] + [cpu_time for cpu_time, _ in results])
+    reference = max(slowest.get('c', 0), slowest.get('cpp', 0))
+    if not reference:
+        raise make_from_full_package.PackageError("The factors are relative to C/C++, but no C or C++ solution ran.")
+    reference = max(reference, MIN_REFERENCE_TIME)
+
+    factors = {}
+    for key, languages in (('JAVA_TL_FACTOR', ('java', 'kt')), ('PYTHON_TL_FACTOR', ('py3',))):
+        times = [slowest[language] for language in languages if language in slowest]
+        if times:
+            ratio = Fraction(max(times) / reference * margin).limit_denominator(1000)
+            factor = max(Fraction(1), ceil(ratio / FACTOR_STEP) * FACTOR_STEP)
+            factors[key] = make_from_full_package.parse_factor(str(factor))
+    return factors
+
+
+def print_report(clang_timelimit, repetitions, solutions, factors):
+    """Prints the times of each solution, the suggested factors and the limits they give to each language."""
+    for path, language, tag, results in solutions:
+        if results is None:
+            print(f"  {path} ({language}, {tag}): compilation error")
+            continue
+        cpu_time, test = max((cpu_time, idx) for idx, (cpu_time, _) in enumerate(results, start=1))
+        failures = [f"test {idx}: {failure}" for idx, (_, failure) in enumerate(results, start=1) if failure]
+        print(f"  {path} ({language}, {tag}): slowest test {test}, {cpu_time:.3f} s")
+        for failure in failures:
+            print("    " + failure)
+
+    print(f"\nC/C++ time limit: {clang_timelimit} s, {repetitions} repetition(s)")
+    for key in ('JAVA_TL_FACTOR', 'PYTHON_TL_FACTOR'):
+        if key not in factors:
+            print(f"{key}: no solution to calibrate it with")
+            continue
+        timelimit, factor_repetitions = make_from_full_package.scale_timelimit(clang_timelimit, repetitions,
+                                                                               factors[key])
+        languages = 'Java and Kotlin' if key == 'JAVA_TL_FACTOR' else 'Python'
+        print(f"{key}: {factors[key]} ({languages}: {timelimit} s, {factor_repetitions} repetition(s))")
+
+
+def write_factors(directory, letter, factors):
+    """Sets the time limit factors of a problem in the contest.json of a contest directory."""
+    file_path = os.path.join(directory, 'contest.json')
+    with open(file_path) as file:
+        problems = json.load(file)
+    entries = [problem for problem in problems if str(problem.get('PROBLEM_LETTER')) == letter]
+    if not entries:
+        raise make_from_full_package.PackageError(f"Problem {letter} not found in {file_path}.")
+    for problem in entries:
+        problem.update(factors)
+    with open(file_path, 'w') as file:
+        json.dump(problems, file, indent=4)
+        file.write('\n')
+
+
+if __name__ == '__main__':
+    """
+    Calibrates the Java and Python time limit factors of a problem by timing its reference solutions.
+
+    Usage: python3 calibrate.py POLYGON_PACKAGE.zip [--jobs N] [--margin X] [--write /path/to/contest/ LETTER]
+
+    The main and accepted solutions of the package are compiled and run on every test with the limits of the run
+    scripts, and the factors that give each language the same room the Polygon time limit gives C/C++ are printed.
+    With --write, they are also saved as the factors of problem LETTER in the contest.json of the contest.
+    """
+    if not hasattr(os, 'wait4'):
+        sys.exit("calibrate.py limits and times the solutions with setrlimit and wait4, which are only available on "
+                 "Unix systems")
+    args = sys.argv[1:]
+    try:
+        jobs = make_from_full_package.pop_option(args, '--jobs', int)
+        margin = make_from_full_package.pop_option(args, '--margin', float) or 1.0
+        contest = None
+        if '--write' in args:
+            position = args.index('--write')
+            if position + 2 >= len(args):
+                raise ValueError("Option --write expects a contest directory and a problem letter.")
+            contest = args[position + 1:position + 3]
+            del args[position:position + 3]
+    except ValueError as e:
+        sys.exit(f"Invalid option: {e}")
+    if jobs is not None and jobs < 1:
+        sys.exit("--jobs expects a positive number of parallel runs")
+    if margin <= 0:
+        sys.exit("--margin expects a positive multiplier")
+    if len(args) != 1:
+        sys.exit("Usage: python3 calibrate.py POLYGON_PACKAGE.zip [--jobs N] [--margin X] "
+                 "[--write /path/to/contest/ LETTER]")
+
+    try:
+        clang_timelimit, repetitions, solutions = time_solutions(args[0], jobs)
+        factors = suggest_factors(solutions, margin)
+        print_report(clang_timelimit, repetitions, solutions, factors)
+        if contest is not None and factors:
+            write_factors(*contest, factors)
+            print(f"Factors of problem {contest[1]} written to {os.path.join(contest[0], 'contest.json')}")
+    except make_from_full_package.PackageError as e:
+        print("Error:", e)
+        sys.exit(1)
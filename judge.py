@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import make_from_full_package
+
+# Language of a submission, by file extension, as the scripts of the package name them
+SUBMISSION_LANGUAGES = {'.c': 'c', '.cpp': 'cpp', '.cc': 'cpp', '.cxx': 'cpp', '.java': 'java', '.kt': 'kt',
+                        '.py': 'py3'}
+
+# Verdicts of the exit codes of the run scripts (safeexec codes) and of the compare scripts
+RUN_VERDICTS = {3: 'TLE', 7: 'MLE', 2: 'RE', 9: 'RE'}
+COMPARE_VERDICTS = {4: 'AC', 5: 'PE', 6: 'WA'}
+
+# Environment variable the safeexec stand-in writes the statistics of its runs to (see tools/safeexec)
+STATS_VARIABLE = 'SAFEEXEC_STATS'
+
+
+def read_limits(package_folder, language):
+    """
+    Runs the limits script of a language, as the autojudge does.
+
+    Returns:
+    tuple: The time limit in seconds, the repetitions, the memory limit in MB and the output limit in KB.
+    """
+    result = subprocess.run(['bash', os.path.join(package_folder, 'limits', language)], capture_output=True, text=True,
+                            check=True)
+    timelimit, repetitions, memory_limit, output_limit = (int(line) for line in result.stdout.split()[:4])
+    return timelimit, repetitions, memory_limit, output_limit
+
+
+def list_tests(package_folder):
+    """
+    Lists the tests of a package, ordered by testset and then by name.
+
+    Returns:
+    list of tuple: The name, input path and answer path of each test.
+    """
+    input_folder = os.path.join(package_folder, 'input')
+    names = sorted(os.listdir(input_folder), key=lambda name: (int(name.rsplit('.', 1)[-1]), name))
+    return [(name, os.path.join(input_folder, name), os.path.join(package_folder, 'output', name)) for name in names]
+
+
+def run_script(command, folder, stats_file=None, stdout=None):
+    """
+    Runs a script of the package in folder, with the safeexec stand-in first on the PATH.
+
+    Returns:
+    tuple: The exit code, the output when stdout is not given, the wall time and the statistics of the safeexec runs
+    (see tools/safeexec), or None when safeexec was not called.
+    """
+    env = dict(os.environ, PATH=make_from_full_package.TOOLS_FOLDER + os.pathsep + os.environ.get('PATH', ''))
+    if stats_file is not None:
+        env[STATS_VARIABLE] = stats_file
+    start = time.perf_counter()
+    result = subprocess.run(['bash'] + command, cwd=folder, env=env, stdout=stdout or subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    stats = None
+    if stats_file is not None and os.path.exists(stats_file):
+        with open(stats_file) as file:
+            stats = json.load(file)
+    return result.returncode, None if stdout else result.stdout.decode(errors='replace'), wall, stats
+
+
+def compile_submission(package_folder, submission, language, work_folder, timelimit, memory_limit):
+    """
+    Compiles a submission with the compile script of its language, as the autojudge does.
+
+    Returns:
+    tuple: The path of the compiled program, or None when it did not compile, the compiler output and the statistics
+    of the compilation (see run_script).
+    """
+    folder = os.path.join(work_folder, 'compile')
+    os.makedirs(folder)
+    source = os.path.basename(submission)
+    shutil.copy(submission, os.path.join(folder, source))
+    exe = os.path.splitext(source)[0]
+    code, output, wall, stats = run_script([os.path.join(package_folder, 'compile', language), source, exe,
+                                            str(timelimit), str(memory_limit)], folder,
+                                           os.path.join(work_folder, 'compile.stats'))
+    # The Java and Kotlin scripts always build run.jar, whatever the name of the program
+    program = next((os.path.join(folder, name) for name in (exe, 'run.jar')
+                    if os.path.exists(os.path.join(folder, name))), None)
+    return (program if code == 0 else None), output, {'code': code, 'wall': wall, 'safeexec': stats}
+
+
+def judge_test(package_folder, compare_folder, language, program, exe, limits, test, work_folder):
+    """
+    Runs the program on one test with the run script and checks its output with the compare script.
+
+    The program is copied to a folder of its own as exe, the name the autojudge gives it: the name of the submission
+    without its extension, which the Java script also runs as the main class.
+
+    Returns:
+    dict: The verdict of the test, the wall time of the run and of the compare script, and the CPU time and memory
+    of the program as measured by the safeexec stand-in.
+    """
+    name, input_file, answer_file = test
+    folder = tempfile.mkdtemp(prefix='test_', dir=work_folder)
+    shutil.copy(program, os.path.join(folder, exe))
+    output_file = os.path.join(folder, 'team_output')
+    timelimit, repetitions, memory_limit, output_limit = limits
+    with open(output_file, 'wb') as output:
+        code, _, run_wall, stats = run_script([os.path.join(package_folder, 'run', language), exe, input_file,
+                                               str(timelimit), str(repetitions), str(memory_limit), str(output_limit)],
+                                              folder, os.path.join(folder, 'run.stats'), output)
+    result = {'test': name, 'run_code': code, 'run_wall': run_wall, 'compare_wall': None,
+              'cpu': stats and stats['cpu'], 'memory_kb': stats and stats['memory_kb']}
+    if code != 0:
+        result['verdict'] = RUN_VERDICTS.get(code, f'run error {code}')
+    else:
+        code, message, result['compare_wall'], _ = run_script([os.path.join(compare_folder, language), output_file,
+                                                               answer_file, input_file], folder)
+        result['verdict'] = COMPARE_VERDICTS.get(code, f'compare error {code}')
+        result['compare_message'] = message.strip().splitlines()[-1] if message.strip() else ''
+    shutil.rmtree(folder, ignore_errors=True)
+    return result
+
+
+def judge(package_folder, submission, language=None, jobs=None, repeat=1, log=print):
+    """
+    Judges a submission against a built package the way the BOCA autojudge does, calling the compile, run and compare
+    scripts of the package with the autojudge arguments, but on this machine and with tests run in parallel.
+
+    The compare folder is copied once and its script run once on the first answer before the tests, so a checker
+    compiled on the first comparison, as on a judge, is compiled only once; that setup is timed on its own.
+
+    Args:
+    package_folder (str): A package built into packages/, such as packages/Problem_A.
+    submission (str): The source file to judge.
+    language (str): The language of the submission (c, cpp, java, kt or py3). Taken from its extension by default.
+    jobs (int): The number of tests judged at the same time. One per CPU by default.
+    repeat (int): How many times to judge every test, to measure the judging throughput.
+    log (callable): Receives the progress messages.
+
+    Returns:
+    dict: The limits, the compilation, the checker setup and the result of every test (see judge_test), and the wall
+    time of judging all the tests.
+    """
+    if language is None:
+        language = SUBMISSION_LANGUAGES.get(os.path.splitext(submission)[1].lower())
+        if language is None:
+            raise make_from_full_package.PackageError(f"Unknown language of {submission}, use --language.")
+    if not os.path.isdir(os.path.join(package_folder, 'run')):
+        raise make_from_full_package.PackageError(f"{package_folder} is not a built package.")
+
+    limits = read_limits(package_folder, language)
+    tests = list_tests(package_folder)
+    report = {'package': package_folder, 'submission': submission, 'language': language,
+              'limits': dict(zip(('timelimit', 'repetitions', 'memory_mb', 'output_kb'), limits))}
+    with tempfile.TemporaryDirectory(prefix='boca_judge_') as work_folder:
+        log(f"Compiling {submission} ({language})...")
+        program, output, report['compile'] = compile_submission(package_folder, submission, language, work_folder,
+                                                                 limits[0], limits[2])
+        if program is None:
+            report['compile']['output'] = output
+            report['verdict'] = 'CE'
+            return report
+
+        compare_folder = os.path.join(work_folder, 'compare')
+        shutil.copytree(os.path.join(package_folder, 'compare'), compare_folder)
+        if tests:
+            _, input_file, answer_file = tests[0]
+            code, _, wall, _ = run_script([os.path.join(compare_folder, language), answer_file, answer_file,
+                                           input_file], work_folder)
+            report['checker_setup'] = {'code': code, 'wall': wall}
+
+        log(f"Judging {len(tests)} test(s){f' {repeat} times' if repeat > 1 else ''}...")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(jobs or os.cpu_count()) as executor:
+            exe = os.path.splitext(os.path.basename(submission))[0]
+            futures = [executor.submit(judge_test, package_folder, compare_folder, language, program, exe, limits,
+                                       test, work_folder) for _ in range(repeat) for test in tests]
+            report['tests'] = [future.result() for future in futures]
+        report['wall'] = time.perf_counter() - start
+    failed = [result['verdict'] for result in report['tests'] if result['verdict'] != 'AC']
+    report['verdict'] = failed[0] if failed else 'AC'
+    return report
+
+
+def print_report(report):
+    """Prints the verdict, times and memory of every test, and the judging throughput."""
+    limits = report['limits']
+    print(f"Limits: {limits['timelimit']} s, {limits['repetitions']} repetition(s), {limits['memory_mb']} MB, "
+          f"{limits['output_kb']} KB of output")
+    compile_stats = report['compile']
+    print(f"Compilation: {compile_stats['wall']:.3f} s, exit code {compile_stats['code']}")
+    if report['verdict'] == 'CE':
+        print(compile_stats.get('output', '').rstrip())
+        print("Verdict: CE")
+        return
+    if 'checker_setup' in report:
+        print(f"Checker setup: {report['checker_setup']['wall']:.3f} s")
+
+    print(f"\n  {'test':<12} {'verdict':<10} {'cpu':>8} {'memory':>10} {'run':>8} {'compare':>8}")
+    for result in report['tests']:
+        cpu = f"{result['cpu']:.3f}" if result['cpu'] is not None else '-'
+        memory = f"{result['memory_kb'] / 1024:.1f} MB" if result['memory_kb'] is not None else '-'
+        compare = f"{result['compare_wall']:.3f}" if result['compare_wall'] is not None else '-'
+        print(f"  {result['test']:<12} {result['verdict']:<10} {cpu:>8} {memory:>10} {result['run_wall']:>8.3f} "
+              f"{compare:>8}")
+
+    tests = report['tests']
+    compares = [result['compare_wall'] for result in tests if result['compare_wall'] is not None]
+    print(f"\nJudged {len(tests)} test run(s) in {report['wall']:.3f} s ({len(tests) / report['wall']:.1f} per second)")
+    if compares:
+        print(f"Compare script: {sum(compares) / len(compares) * 1000:.1f} ms per test on average")
+    print("Verdict:", report['verdict'])
+
+
+if __name__ == '__main__':
+    """
+    Judges a submission locally against a built package, running its compile, run and compare scripts.
+
+    Usage: python3 judge.py PROBLEM_LETTER|PACKAGE_FOLDER SUBMISSION [--language c|cpp|java|kt|py3] [--jobs N]
+                            [--repeat N] [--json PATH]
+
+    The scripts call tools/safeexec instead of the real safeexec, which applies the limits without a jail. The exit
+    code is 0 when every test is accepted.
+    """
+    args = sys.argv[1:]
+    try:
+        language = make_from_full_package.pop_option(args, '--language', str)
+        jobs = make_from_full_package.pop_option(args, '--jobs', int)
+        repeat = make_from_full_package.pop_option(args, '--repeat', int) or 1
+        json_file = make_from_full_package.pop_option(args, '--json', str)
+    except ValueError as e:
+        sys.exit(f"Invalid option: {e}")
+    if language is not None and language not in SUBMISSION_LANGUAGES.values():
+        sys.exit("--language expects one of c, cpp, java, kt or py3")
+    if jobs is not None and jobs < 1:
+        sys.exit("--jobs expects a positive number of parallel tests")
+    if repeat < 1:
+        sys.exit("--repeat expects a positive number of repetitions")
+    if len(args) != 2:
+        sys.exit("Usage: python3 judge.py PROBLEM_LETTER|PACKAGE_FOLDER SUBMISSION [--language c|cpp|java|kt|py3] "
+                 "[--jobs N] [--repeat N] [--json PATH]")
+
+    package = args[0]
+    if len(package) == 1 and package.isupper():
+        package = os.path.join(make_from_full_package.SCRIPT_FOLDER, 'packages', f'Problem_{package}')
+    try:
+        judge_report = judge(package, args[1], language, jobs, repeat)
+    except (make_from_full_package.PackageError, subprocess.CalledProcessError, OSError) as e:
+        print("Error:", e)
+        sys.exit(1)
+    print_report(judge_report)
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(judge_report, file, indent=2)
+    sys.exit(0 if judge_report['verdict'] == 'AC' else 1)
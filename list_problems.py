@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import make_from_full_package
+
+
+def find_packages(paths):
+    """Lists the zip files among paths, searching folders recursively, in the order given and then by name."""
+    packages = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, folders, files in os.walk(path):
+                folders.sort()
+                packages += [os.path.join(root, file) for file in sorted(files) if file.lower().endswith('.zip')]
+        else:
+            packages.append(path)
+    return packages
+
+
+def read_metadata(package, cache_folder):
+    """Returns the metadata of a package (see make_from_full_package.problem_metadata), or the error reading it."""
+    try:
+        return make_from_full_package.problem_metadata(package, cache_folder)
+    except make_from_full_package.PackageError as e:
+        return {'error': str(e)}
+
+
+def print_table(packages, results):
+    """Prints the name, limits and number of tests of each package."""
+    width = max([len('package')] + [len(package) for package in packages])
+    print(f"{'package':<{width}}  {'TL':>8}  {'ML':>7}  {'tests':>5}  name")
+    for package, metadata in zip(packages, results):
+        if 'error' in metadata:
+            print(f"{package:<{width}}  error: {metadata['error']}")
+            continue
+        tests = sum(metadata['testsets'].values())
+        print(f"{package:<{width}}  {metadata['time_limit_ms'] / 1000:>6.2f} s  {metadata['memory_limit']:>4} MB  "
+              f"{tests:>5}  {metadata['name']}" + ("" if metadata['statement_pdf'] else "  (no Portuguese PDF)"))
+
+
+if __name__ == '__main__':
+    """
+    Lists the name, time limit, memory limit and number of tests of Polygon packages, without building them.
+
+    Usage: python3 list_problems.py PACKAGE.zip|FOLDER... [--jobs N] [--json] [--no-cache]
+
+    Folders are searched recursively for zip files. Only the central directory and the start of problem.xml of each
+    package are read, and the result is cached in the cache folder by the contents of the central directory.
+    """
+    args = sys.argv[1:]
+    try:
+        jobs = make_from_full_package.pop_option(args, '--jobs', int)
+    except ValueError as e:
+        sys.exit(f"Invalid option: {e}")
+    if jobs is not None and jobs < 1:
+        sys.exit("--jobs expects a positive number of packages read at the same time")
+    as_json = '--json' in args
+    use_cache = '--no-cache' not in args
+    args = [arg for arg in args if arg not in ('--json', '--no-cache')]
+    if not args:
+        sys.exit("Usage: python3 list_problems.py PACKAGE.zip|FOLDER... [--jobs N] [--json] [--no-cache]")
+
+    polygon_packages = find_packages(args)
+    cache = os.path.join(make_from_full_package.SCRIPT_FOLDER, make_from_full_package.CACHE_FOLDER) if use_cache \
+        else None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(jobs) as executor:
+        metadata_list = list(executor.map(lambda package: read_metadata(package, cache), polygon_packages))
+    wall = time.perf_counter() - start
+
+    if as_json:
+        json.dump(dict(zip(polygon_packages, metadata_list)), sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        print_table(polygon_packages, metadata_list)
+        print(f"\n{len(polygon_packages)} package(s) read in {wall:.3f} s")
+    sys.exit(1 if any('error' in metadata for metadata in metadata_list) else 0)
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 import glob
+import io
 import os
 import json
 import shutil
-import subprocess
 import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
 from pathlib import Path
 import make_from_full_package
+import publish
 
 def read_contest_file(directory):
     """Reads the contest configuration from a JSON file."""
@@ -30,41 +36,361 @@ def find_polygon_package(directory, problem):
         return file_list[0]
     return problem["POLYGON_PACKAGE"]
 
-def run_main_script(problem, directory):
-    """Executes the make_from_full_package.py script for a given problem."""
-    file_name = find_polygon_package(directory, problem)
-    if not file_name:
-        return
-    command = ["python3", "make_from_full_package.py", str(problem["PROBLEM_LETTER"]), file_name,
-               str(problem["JAVA_TL_FACTOR"]), str(problem["PYTHON_TL_FACTOR"])]
-    subprocess.run(command)
-
-def clean_folders():
-    """Cleans and backs up the directories before the contest setup."""
-    packages_folder = Path("packages")
-    zip_folder = Path("zip_packages")
+def run_main_script(problem, directory, options=None, capture_output=False, collect_metrics=False):
+    """
+    Builds the package of a given problem in-process and reports how it went.
+
+    The options are keyword arguments for make_from_full_package.make_problem.
+
+    When capture_output is set, the progress messages of the build are collected and returned instead of printed,
+    so builds running at the same time do not interleave their output. When collect_metrics is set, the counters of
+    each build stage are returned (see make_from_full_package.measure_stage).
+
+    Returns:
+    tuple: The problem letter, its status ("OK", "SKIPPED" or "FAILED"), the captured output and the metrics.
+    """
+    letter = str(problem["PROBLEM_LETTER"])
+    output = io.StringIO()
+    metrics = {} if collect_metrics else None
+    with redirect_stdout(output if capture_output else sys.stdout):
+        file_name = find_polygon_package(directory, problem)
+        if not file_name:
+            return letter, "SKIPPED", output.getvalue(), metrics
+        factors = []
+        for key in ("JAVA_TL_FACTOR", "PYTHON_TL_FACTOR"):
+            try:
+                factors.append(make_from_full_package.parse_factor(str(problem[key])))
+            except (KeyError, ValueError, ZeroDivisionError):
+                print(f"Error: {key} must be a positive number, such as 2 or 1.5.")
+                return letter, "FAILED", output.getvalue(), metrics
+        try:
+            with make_from_full_package.measure_stage(metrics, 'total'):
+                make_from_full_package.make_problem(letter, file_name, *factors, **(options or {}), metrics=metrics)
+        except Exception as e:
+            print("Error:", e)
+            return letter, "FAILED", output.getvalue(), metrics
+    return letter, "OK", output.getvalue(), metrics
+
+def duplicate_letters(problems):
+    """Returns the problem letters used by more than one problem, with the number of problems using each."""
+    letters = Counter(str(problem.get("PROBLEM_LETTER")) for problem in problems)
+    return {letter: count for letter, count in sorted(letters.items()) if count > 1}
+
+def build_problems(problems, directory, jobs=1, options=None, collect_metrics=False):
+    """
+    Builds every problem of the contest, running up to jobs builds at the same time in separate processes.
+
+    Problems sharing a letter would write to the same folders, so none of them is built and they are reported as
+    FAILED, as is a problem whose worker process died (for instance, killed for using too much memory).
+
+    Returns:
+    tuple: The status of each problem and, when collect_metrics is set, the metrics of each build, both keyed by
+    problem letter.
+    """
+    statuses = {}
+    problem_metrics = {}
+    duplicates = duplicate_letters(problems)
+    for letter, count in duplicates.items():
+        print(f"Error: Problem letter {letter} is used by {count} problems.")
+        statuses[letter] = "FAILED"
+    problems = [problem for problem in problems if str(problem["PROBLEM_LETTER"]) not in duplicates]
+    if jobs <= 1:
+        for problem in problems:
+            letter, status, _, metrics = run_main_script(problem, directory, options, False, collect_metrics)
+            statuses[letter] = status
+            if metrics:
+                problem_metrics[letter] = metrics
+        return statuses, problem_metrics
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_main_script, problem, directory, options, True, collect_metrics):
+                   str(problem["PROBLEM_LETTER"]) for problem in problems}
+        for future in as_completed(futures):
+            try:
+                letter, status, output, metrics = future.result()
+            except BrokenProcessPool:
+                letter, status, output, metrics = futures[future], "FAILED", "", None
+                print(f"Error: The build of problem {letter} was interrupted, its process exited unexpectedly.")
+            print(output, end='')
+            statuses[letter] = status
+            if metrics:
+                problem_metrics[letter] = metrics
+    return statuses, problem_metrics
+
+def print_summary(problems, statuses):
+    """Prints the build status of each problem, in contest order."""
+    print("Summary:")
+    for letter in dict.fromkeys(str(problem["PROBLEM_LETTER"]) for problem in problems):
+        print(f"  Problem {letter}: {statuses.get(letter, 'SKIPPED')}")
+
+def check_contest(problems, directory):
+    """
+    Validates the contest configuration and the Polygon package of every problem, without building anything.
+
+    Only the central directories and problem.xml files of the packages are read, all at the same time (see
+    make_from_full_package.check_problem). The errors and warnings found are printed per problem.
+
+    Returns:
+    bool: True when no errors were found.
+    """
+    contest_errors = [f"Problem letter {letter} is used by {count} problems."
+                      for letter, count in duplicate_letters(problems).items()]
+
+    results = {}
+    with ThreadPoolExecutor() as executor:
+        futures = {}
+        for position, problem in enumerate(problems):
+            errors = []
+            missing_keys = [key for key in ("PROBLEM_LETTER", "POLYGON_PACKAGE", "JAVA_TL_FACTOR", "PYTHON_TL_FACTOR")
+                            if key not in problem]
+            if missing_keys:
+                errors.append(f"Missing {', '.join(missing_keys)} in contest.json.")
+            elif not (str(problem["PROBLEM_LETTER"]).isupper() and len(str(problem["PROBLEM_LETTER"])) == 1):
+                errors.append("The problem letter must be a capital letter and one character long.")
+            for key in ("JAVA_TL_FACTOR", "PYTHON_TL_FACTOR"):
+                try:
+                    make_from_full_package.parse_factor(str(problem.get(key, 1)))
+                except (ValueError, ZeroDivisionError):
+                    errors.append(f"{key} must be a positive number, such as 2 or 1.5.")
+            if errors:
+                results[position] = (errors, [])
+                continue
+            search_output = io.StringIO()
+            with redirect_stdout(search_output):
+                file_name = find_polygon_package(directory, problem)
+            if not file_name:
+                results[position] = ([search_output.getvalue().strip().replace(", skipping...", ".")], [])
+            elif not os.path.exists(file_name):
+                results[position] = ([f"The file {file_name} does not exist."], [])
+            else:
+                futures[executor.submit(make_from_full_package.check_problem, file_name)] = position
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    print("Check:")
+    for error in contest_errors:
+        print("  error:", error)
+    for position, problem in enumerate(problems):
+        errors, warnings = results[position]
+        status = "OK" if not errors and not warnings else f"{len(errors)} error(s), {len(warnings)} warning(s)"
+        print(f"  Problem {problem.get('PROBLEM_LETTER', '?')}: {status}")
+        for error in errors:
+            print("    error:", error)
+        for warning in warnings:
+            print("    warning:", warning)
+    return not contest_errors and not any(errors for errors, _ in results.values())
+
+def report_metrics(problem_metrics, wall_time, jobs, profile, metrics_json):
+    """
+    Combines the metrics of every build into a contest-wide report.
+
+    The report has the counters of each stage summed over all problems, the counters of each problem, and the wall
+    time of the whole contest build (smaller than the summed stage times when problems are built in parallel). It is
+    printed as tables when profile is set and written as JSON to metrics_json when given.
+    """
+    totals = {}
+    for metrics in problem_metrics.values():
+        make_from_full_package.merge_metrics(totals, metrics)
+    if profile:
+        print(f"Contest build took {wall_time:.3f} s with {jobs} job(s). Stages summed over all problems:")
+        print(make_from_full_package.format_metrics(totals))
+        print("\nPer problem:")
+        print(make_from_full_package.format_metrics({f"Problem {letter}": metrics['total']
+                                                     for letter, metrics in sorted(problem_metrics.items())}))
+    if metrics_json:
+        with open(metrics_json, 'w') as metrics_file:
+            json.dump({'wall': wall_time, 'jobs': jobs, 'totals': totals, 'problems': problem_metrics}, metrics_file,
+                      indent=2)
+
+def parse_options(args):
+    """
+    Removes the contest build options from args.
+
+    Returns:
+    tuple: The number of parallel builds and a dict of keyword options for make_from_full_package.make_problem,
+    plus 'check', 'profile', 'metrics_json' and 'publish' (the --publish targets) for the script itself.
+    """
+    options = {}
+    try:
+        jobs = make_from_full_package.pop_option(args, '--jobs', int)
+        cache_size = make_from_full_package.pop_option(args, '--cache-size', int)
+        cache_age = make_from_full_package.pop_option(args, '--cache-age', int)
+        keep_backups = make_from_full_package.pop_option(args, '--keep-backups', int)
+        options['metrics_json'] = make_from_full_package.pop_option(args, '--metrics-json', str)
+        options['publish'] = []
+        target = make_from_full_package.pop_option(args, '--publish', str)
+        while target is not None:
+            options['publish'].append(target)
+            target = make_from_full_package.pop_option(args, '--publish', str)
+        store = make_from_full_package.pop_option(args, '--blob-store', os.path.abspath)
+        if store is not None:
+            options['blob_store_folder'] = store
+        compression_level = make_from_full_package.pop_option(args, '--compression-level',
+                                                              make_from_full_package.parse_compression_level)
+        threads = make_from_full_package.pop_option(args, '--threads', int)
+        for name, option in (('--disk-budget', 'disk_budget'), ('--memory-budget', 'memory_budget')):
+            budget = make_from_full_package.pop_option(args, name, int)
+            if budget is not None:
+                if budget < 1:
+                    sys.exit(f"{name} expects a positive number of megabytes")
+                options[option] = budget
+    except ValueError as e:
+        sys.exit(f"Invalid option: {e}")
+    if jobs is not None and jobs < 1:
+        sys.exit("--jobs expects a positive number of parallel builds")
+    if keep_backups is not None:
+        if keep_backups < 1:
+            sys.exit("--keep-backups expects a positive number of backups")
+        options['keep_backups'] = keep_backups
+    if threads is not None:
+        if threads < 1:
+            sys.exit("--threads expects a positive number of threads")
+        options['threads'] = threads
+    if compression_level is not None:
+        options['compression_level'] = compression_level
+    if cache_size is not None:
+        options['cache_max_size'] = cache_size
+    if cache_age is not None:
+        options['cache_max_age'] = cache_age
+    if '--cache' in args:
+        args.remove('--cache')
+        options['cache'] = True
+    if '--compile-checker' in args:
+        args.remove('--compile-checker')
+        options['compile_checker_binary'] = True
+    if '--watch' in args:
+        args.remove('--watch')
+        options['incremental'] = True
+    if '--fast-compare' in args:
+        args.remove('--fast-compare')
+        options['fast_compare'] = True
+    options['check'] = '--check' in args
+    if options['check']:
+        args.remove('--check')
+    options['profile'] = '--profile' in args
+    if options['profile']:
+        args.remove('--profile')
+    return jobs or 1, options
+
+def publish_built(targets, statuses):
+    """Sends the packages that were just built to the publish targets, where they changed (see publish.py)."""
+    letters = [letter for letter, status in statuses.items() if status == "OK"]
+    if not targets or not letters:
+        return True
+    print("Publishing problem(s) " + ", ".join(sorted(letters)))
+    try:
+        reports = publish.publish_packages(targets, letters)
+    except make_from_full_package.PackageError as e:
+        print("Error:", e)
+        return False
+    publish.print_report(reports)
+    return not any(report['failed'] for report in reports)
+
+def problem_signatures(directory):
+    """
+    Returns what each problem of the contest is built from: its entry in contest.json and the path, modification
+    time and size of its Polygon package, keyed by problem letter. Returns None while contest.json can not be read,
+    for instance halfway through being saved.
+    """
+    try:
+        problems = read_contest_file(directory)
+    except (SystemExit, ValueError):
+        return None
+    signatures = {}
+    with redirect_stdout(io.StringIO()):  # the package search reports missing files on every poll otherwise
+        for problem in problems:
+            file_name = find_polygon_package(directory, problem)
+            package_signature = file_name and make_from_full_package.file_signature(file_name)
+            signatures[str(problem["PROBLEM_LETTER"])] = (json.dumps(problem, sort_keys=True), file_name,
+                                                          package_signature)
+    return signatures
+
+def clean_folders(keep=(), keep_backups=None, store=None):
+    """
+    Cleans and backs up the directories before the contest setup.
+
+    Problems whose letter is in keep are left in place, so a cached build can reuse them; their build backs them up
+    itself if it has to replace them. When keep_backups is given, only that many backups are kept per problem. When
+    store is given, backed up files are hard links to the blobs of that blob store. A failed backup raises
+    make_from_full_package.PackageError, and the package is then left in place.
+    """
+    packages_folder = Path(make_from_full_package.SCRIPT_FOLDER) / "packages"
+    zip_folder = Path(make_from_full_package.SCRIPT_FOLDER) / "zip_packages"
     if zip_folder.exists():
-        shutil.rmtree(zip_folder)
-    backup_base = Path("backups")
+        for zip_path in zip_folder.iterdir():
+            if zip_path.name.split('.')[0].split('_')[-1] not in keep:
+                if zip_path.is_dir():
+                    shutil.rmtree(zip_path)
+                else:
+                    zip_path.unlink()
+    backup_base = Path(make_from_full_package.SCRIPT_FOLDER) / "backups"
     backup_base.mkdir(exist_ok=True)
 
     if packages_folder.exists():
-        for folder_path in packages_folder.iterdir():
+        # Folders first, since their backups read the file indexes removed below
+        for folder_path in sorted(packages_folder.iterdir(), key=lambda path: not path.is_dir()):
             if folder_path.is_dir():  # Make sure it's a directory
                 problem_idx = folder_path.name.split('_')[-1]
+                if problem_idx in keep:
+                    continue
                 # Call the backup function from main
-                make_from_full_package.backup(str(folder_path), str(backup_base), problem_idx)
+                make_from_full_package.backup(str(folder_path), str(backup_base), problem_idx, keep_backups, store,
+                                              str(packages_folder / ('.' + folder_path.name + '.index')))
                 shutil.rmtree(folder_path)
+            elif folder_path.name.endswith(('.key', '.index')) and \
+                    folder_path.name.split('.')[1].split('_')[-1] not in keep:
+                folder_path.unlink()  # build cache stamp or file index of a removed package
 
 if __name__ == "__main__":
-    make_from_full_package.check_run_directory()
-    if len(sys.argv) < 2:
-        sys.exit("Usage: python3 make_contest.py /path/to/contest/")
-    contest_directory = sys.argv[1]
+    args = sys.argv[1:]
+    jobs, options = parse_options(args)
+    profile = options.pop('profile')
+    metrics_json = options.pop('metrics_json')
+    check = options.pop('check')
+    publish_targets = options.pop('publish')
+    if len(args) < 1:
+        sys.exit("Usage: python3 make_contest.py /path/to/contest/ [--jobs N] [--cache] [--cache-size MB] "
+                 "[--cache-age DAYS] [--keep-backups N] [--compile-checker] [--fast-compare] [--profile] "
+                 "[--metrics-json PATH] [--compression-level N|store] [--threads N] [--watch] "
+                 "[--disk-budget MB] [--memory-budget MB] [--blob-store DIR] [--publish FOLDER|URL]... [--check]")
+    contest_directory = args[0]
     if not os.path.exists(contest_directory):
         sys.exit(f"The directory {contest_directory} does not exist")
-    print("Backing up any existing packages")
-    clean_folders()
     problems = read_contest_file(contest_directory)
-    for problem in problems:
-        run_main_script(problem, contest_directory)
+    if check:
+        sys.exit(0 if check_contest(problems, contest_directory) else 1)
+    print("Backing up any existing packages")
+    try:
+        if options.get('cache'):
+            clean_folders({str(problem["PROBLEM_LETTER"]) for problem in problems}, options.get('keep_backups'),
+                          options.get('blob_store_folder'))
+        else:
+            clean_folders(keep_backups=options.get('keep_backups'), store=options.get('blob_store_folder'))
+    except (make_from_full_package.PackageError, OSError) as e:
+        print("Error:", e)
+        sys.exit(1)
+    start = time.perf_counter()
+    statuses, problem_metrics = build_problems(problems, contest_directory, jobs, options,
+                                               profile or metrics_json is not None)
+    wall_time = time.perf_counter() - start
+    print_summary(problems, statuses)
+    if profile or metrics_json:
+        report_metrics(problem_metrics, wall_time, jobs, profile, metrics_json)
+    published = publish_built(publish_targets, statuses)
+
+    if options.get('incremental'):
+        def rebuild(letters):
+            changed = [problem for problem in read_contest_file(contest_directory)
+                       if str(problem["PROBLEM_LETTER"]) in letters]
+            print("Rebuilding problem(s) " + ", ".join(letters))
+            start = time.perf_counter()
+            statuses, problem_metrics = build_problems(changed, contest_directory, jobs, options,
+                                                       profile or metrics_json is not None)
+            print_summary(changed, statuses)
+            if profile or metrics_json:
+                report_metrics(problem_metrics, time.perf_counter() - start, jobs, profile, metrics_json)
+            publish_built(publish_targets, statuses)
+
+        make_from_full_package.watch(lambda: problem_signatures(contest_directory), rebuild)
+    elif not published or any(status == "FAILED" for status in statuses.values()):
+        sys.exit(1)
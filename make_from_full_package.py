@@ -1,14 +1,104 @@
 #!/usr/bin/env python3
-import atexit
 from datetime import datetime
 
-from math import gcd
+from fractions import Fraction
+from math import ceil, gcd
+import errno
+import filecmp
+import hashlib
+import io
+import json
 import sys
+import time
 import os
+import stat
+import struct
+import subprocess
 import xml.etree.ElementTree as eT
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 import tempfile
 import zipfile
-from shutil import rmtree, copy, copytree, make_archive
+from shutil import rmtree, copy, copy2, copyfileobj, copystat, disk_usage
+import blob_store
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Folder of this script, and of the package template and tools next to it
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_FOLDER = os.path.join(SCRIPT_FOLDER, 'problem_template')
+TOOLS_FOLDER = os.path.join(SCRIPT_FOLDER, 'tools')
+
+# Size of the buffer used when streaming files between archives
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Files every Polygon package must have to be built
+REQUIRED_FILES = ['check.cpp', 'files/testlib.h', 'problem.xml', 'statements/.pdf/portuguese/problem.pdf']
+
+# problem.xml is read in chunks of this size, and only up to the end of its judging section (see parse_problem_xml)
+XML_CHUNK_SIZE = 64 * 1024
+
+# Longest time limit for C/C++ that BOCA judges handle well, in seconds
+MAX_CLANG_TIMELIMIT = 10
+
+# Most repetitions a time limit scaled by a fractional factor is rounded up to take, since every repetition runs each
+# test once more
+MAX_SCALED_REPETITIONS = 10
+
+# Members are compressed in chunks of this size, each chunk on a thread of its own
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Size of the deflate window; each chunk is compressed with this much of the previous one as its dictionary
+DEFLATE_WINDOW_SIZE = 32 * 1024
+
+# Value of --compression-level that stores the members without compressing them
+STORE_LEVEL = 'store'
+
+# Bytes a zip member takes besides its data and name (local header, central directory record and zip64 extras), and
+# bytes of the end of central directory records
+ZIP_ENTRY_SIZE = 128
+ZIP_END_SIZE = 128
+
+# Timestamp and permissions of every entry of the BOCA zip, fixed so that building the same package twice gives the
+# same bytes. 1980-01-01 is the earliest date a zip file can hold.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+FILE_MODE = 0o644
+EXECUTABLE_MODE = 0o755
+
+# Folders of a BOCA package, in the order they are written to the zip file
+PACKAGE_FOLDERS = ['compare', 'compile', 'description', 'input', 'limits', 'output', 'run']
+
+# Folder of the build cache and its default limits
+CACHE_FOLDER = 'cache'
+CACHE_MAX_SIZE_MB = 10240
+CACHE_MAX_AGE_DAYS = 30
+
+# Command that compiles the checker, the same as the compare scripts use plus -static so that the binary also runs on
+# judges with a different C++ runtime than the machine building the package
+CHECKER_COMPILE_COMMAND = ['g++', '-O2', '--std=c++17', '-static', '-o', 'check', 'check.cpp']
+
+# Command that compiles the comparator used by the compare scripts when there is no checker
+FAST_COMPARATOR_COMPILE_COMMAND = ['gcc', '-O2', '-static', '-o', 'fastcmp', 'fastcmp.c']
+
+# How often --watch checks the Polygon packages for changes, in seconds
+WATCH_INTERVAL = 1
+
+# ioctl request that makes a file share the data blocks of another one (reflink), on Btrfs, XFS and similar
+FICLONE = 0x40049409
+
+
+class PackageError(Exception):
+    """Raised when a BOCA package can not be built, with a message that tells what is wrong."""
 
 
 def ensure_dir_exists(directory):
@@ -20,8 +110,7 @@ def ensure_dir_exists(directory):
     Args:
     directory (str): The path to the directory to check and ensure exists.
     """
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    os.makedirs(directory, exist_ok=True)  # may be created by another thread at the same time
 
 
 def clean_directory(directory):
@@ -39,52 +128,120 @@ def clean_directory(directory):
     os.makedirs(directory)
 
 
-def make_limits(limits_folder, repetitions, memory_limit, clang_timelimit, java_timelimit, python_timelimit):
+def make_limits(members, time_limits, memory_limit):
     """
     Creates limit files for each language supported by the Maratona de Programação.
 
     Each file contains specific settings for the time limit, number of repetitions, and memory limit applicable to
     the programming language.
 
-    Args: limits_folder (str): The path to the directory where the limits files will be created. repetitions (int):
-    The number of repetitions each test case will be executed (and all repetitions should finish within the time
-    limit). memory_limit (int): The maximum amount of memory each test case can use, specified in megabytes (MB).
-    clang_timelimit (int): The time limit for languages processed by Clang (C and C++), specified in seconds.
-    java_timelimit (int): The time limit for Java, specified in seconds. python_timelimit (int): The time limit for
-    Python, specified in seconds.
+    Args:
+    members (dict): The package members being assembled (see write_package).
+    time_limits (dict): Maps each language extension to its time limit in seconds and the number of repetitions each
+    test case will be executed (and all repetitions should finish within the time limit).
+    memory_limit (int): The maximum amount of memory each test case can use, specified in megabytes (MB).
 
     The function creates a file for each specified language, writing the limits according to the given constraints.
     """
     try:
-        # Define time limits for each language or language group
-        time_limits = {
-            'c': clang_timelimit,
-            'cpp': clang_timelimit,
-            'java': java_timelimit,
-            'kt': java_timelimit,
-            'py3': python_timelimit
-        }
-
         # Language extensions for the limits files
         limit_file_extensions = ['c', 'cpp', 'java', 'kt', 'py3']
 
-        # Create and write limits to each file
+        # Create the limits file of each language
         for ext in limit_file_extensions:
-            file_path = os.path.join(limits_folder, ext)
-            with open(file_path, 'w') as limit_file:
-                timelimit = time_limits.get(ext, None)
-                if timelimit is None:
-                    raise ValueError(f"Unknown language extension: {ext}")
-
-                # Write the limits
-                limit_file.write(f"echo {timelimit}\n") # keeps the polygon timelimit
-                limit_file.write(f"echo {repetitions}\n") # keeps the polygon timelimit
-                limit_file.write(f"echo {memory_limit}\n")
-                limit_file.write("echo 15360\n")
-                limit_file.write("exit 0\n")
+            if ext not in time_limits:
+                raise ValueError(f"Unknown language extension: {ext}")
+            timelimit, repetitions = time_limits[ext]
+
+            # Write the limits
+            limit_file = f"echo {timelimit}\n"  # keeps the polygon timelimit
+            limit_file += f"echo {repetitions}\n"  # keeps the polygon timelimit
+            limit_file += f"echo {memory_limit}\n"
+            limit_file += "echo 15360\n"
+            limit_file += "exit 0\n"
+            members['limits/' + ext] = ('data', limit_file.encode())
     except Exception as e:
-        print("Error:", e)
-        sys.exit(1)
+        raise PackageError(str(e)) from e
+
+
+def split_timelimit(time_limit_milliseconds):
+    """
+    Turns a time limit in milliseconds into a whole number of seconds and the number of repetitions of each test that
+    must finish within it, since BOCA only takes time limits in whole seconds.
+
+    Returns:
+    tuple: The time limit in seconds and the number of repetitions.
+    """
+    # Using gcd to compute lcm
+    gcd_time = gcd(1000, time_limit_milliseconds)
+    timelimit = (1000 * time_limit_milliseconds) // gcd_time
+    repetitions = timelimit // time_limit_milliseconds
+    return timelimit // 1000, repetitions  # Convert milliseconds to seconds
+
+
+def scale_timelimit(clang_timelimit, repetitions, factor):
+    """
+    Multiplies the C/C++ time limit of a problem by the time limit factor of another language.
+
+    Whole factors multiply the time limit and keep the repetitions. Fractional factors, such as 1.5, scale the time
+    limit of a single run, rounded up to the next millisecond that splits into at most MAX_SCALED_REPETITIONS
+    repetitions with split_timelimit.
+
+    Args:
+    clang_timelimit (int): The C/C++ time limit in seconds.
+    repetitions (int): The number of repetitions of the C/C++ time limit.
+    factor (int, float or str): The time limit factor.
+
+    Returns:
+    tuple: The time limit in seconds and the number of repetitions of the language.
+    """
+    factor = Fraction(str(factor))
+    if factor.denominator == 1:
+        return clang_timelimit * factor.numerator, repetitions
+    time_limit_milliseconds = ceil(Fraction(clang_timelimit * 1000, repetitions) * factor)
+    while 1000 // gcd(1000, time_limit_milliseconds) > MAX_SCALED_REPETITIONS:
+        time_limit_milliseconds += 1
+    return split_timelimit(time_limit_milliseconds)
+
+
+def parse_factor(value):
+    """Converts a time limit factor, such as 2, 1.5 or 3/2, to an int when it is whole and to a float otherwise."""
+    factor = Fraction(value)
+    if factor <= 0:
+        raise ValueError("Time limit factors must be positive.")
+    return factor.numerator if factor.denominator == 1 else float(factor)
+
+
+def pop_option(args, name, convert):
+    """
+    Removes an option that takes a value ("--name VALUE") from args and returns its converted value.
+
+    Args:
+    args (list of str): Command line arguments, modified in place.
+    name (str): The option name, including the leading dashes.
+    convert (callable): Converts the value string, raising ValueError when it is invalid.
+
+    Returns:
+    The converted value, or None when the option is absent.
+    """
+    if name not in args:
+        return None
+    position = args.index(name)
+    if position + 1 >= len(args):
+        raise ValueError(f"Option {name} expects a value.")
+    value = convert(args[position + 1])
+    del args[position:position + 2]
+    return value
+
+
+def parse_compression_level(value):
+    """Converts the value of --compression-level: a zlib level from 0 to 9, or 'store' to not compress at all."""
+    if value == STORE_LEVEL:
+        return value
+    level = int(value)
+    if not 0 <= level <= 9:
+        raise ValueError("--compression-level expects a level from 0 to 9 or 'store'.")
+    return level
 
 
 def validate_arguments(args):
@@ -97,26 +254,66 @@ def validate_arguments(args):
     args (list of str): Command line arguments provided to the script.
 
     Returns:
-    tuple: Contains the validated problem index, file name, time limit factors for Java and Python, and no_backup flag.
+    tuple: Contains the validated problem index, file name, time limit factors for Java and Python, and a dict of
+    keyword options for make_problem, plus 'profile', 'metrics_json' and 'watch' for the script itself.
 
     Errors are handled by raising exceptions for specific invalid conditions and printing error messages before exiting.
     """
     try:
-        no_backup = '--no-backup' in args
-        zip_only = '--zip-only' in args
-        args = [a for a in args if a not in ('--no-backup', '--zip-only')]
+        args = list(args)
+        options = {}
+        cache_size = pop_option(args, '--cache-size', int)
+        if cache_size is not None:
+            options['cache_max_size'] = cache_size
+        cache_age = pop_option(args, '--cache-age', int)
+        if cache_age is not None:
+            options['cache_max_age'] = cache_age
+        metrics_json = pop_option(args, '--metrics-json', str)
+        if metrics_json is not None:
+            options['metrics_json'] = metrics_json
+        store = pop_option(args, '--blob-store', os.path.abspath)
+        if store is not None:
+            options['blob_store_folder'] = store
+        keep_backups = pop_option(args, '--keep-backups', int)
+        if keep_backups is not None:
+            if keep_backups < 1:
+                raise ValueError("--keep-backups expects a positive number of backups.")
+            options['keep_backups'] = keep_backups
+        compression_level = pop_option(args, '--compression-level', parse_compression_level)
+        if compression_level is not None:
+            options['compression_level'] = compression_level
+        threads = pop_option(args, '--threads', int)
+        if threads is not None:
+            if threads < 1:
+                raise ValueError("--threads expects a positive number of threads.")
+            options['threads'] = threads
+        for name, option in (('--disk-budget', 'disk_budget'), ('--memory-budget', 'memory_budget')):
+            budget = pop_option(args, name, int)
+            if budget is not None:
+                if budget < 1:
+                    raise ValueError(f"{name} expects a positive number of megabytes.")
+                options[option] = budget
+
+        flags = ('--no-backup', '--zip-only', '--recompress', '--cache', '--compile-checker', '--fast-compare',
+                 '--profile', '--watch')
+        no_backup, zip_only, recompress, cache, compile_checker_binary, fast_compare, profile, watch_package = \
+            (flag in args for flag in flags)
+        args = [a for a in args if a not in flags]
 
         # Check minimum number of arguments
         if len(args) < 3:
             raise ValueError("Usage: python3 make_from_full_package.py PROBLEM_LETTER POLYGON_PACKAGE.zip [java_tl_factor] ["
-                             "python_tl_factor] [--no-backup] [--zip-only]")
+                             "python_tl_factor] [--no-backup] [--zip-only] [--recompress] [--cache] [--cache-size MB] "
+                             "[--cache-age DAYS] [--keep-backups N] [--compile-checker] [--fast-compare] [--profile] "
+                             "[--metrics-json PATH] [--compression-level N|store] [--threads N] [--watch] "
+                             "[--disk-budget MB] [--memory-budget MB] [--blob-store DIR]")
 
         problem_idx = args[1]
         file_name = args[2]
 
         # Default time limit factors
-        java_tl_factor = 1 if len(args) < 4 else int(args[3])
-        python_tl_factor = 1 if len(args) < 5 else int(args[4])
+        java_tl_factor = 1 if len(args) < 4 else parse_factor(args[3])
+        python_tl_factor = 1 if len(args) < 5 else parse_factor(args[4])
 
         # Validate problem index
         if not (problem_idx.isupper() and len(problem_idx) == 1):
@@ -130,50 +327,140 @@ def validate_arguments(args):
         if not file_name.endswith('.zip'):
             raise ValueError("The file must be a zip file.")
 
-        return problem_idx, file_name, java_tl_factor, python_tl_factor, no_backup, zip_only
+        options.update({'no_backup': no_backup, 'zip_only': zip_only, 'raw_copy': not recompress, 'cache': cache,
+                        'compile_checker_binary': compile_checker_binary, 'fast_compare': fast_compare,
+                        'profile': profile, 'watch': watch_package})
+        return problem_idx, file_name, java_tl_factor, python_tl_factor, options
     except Exception as e:
         print("Error:", e)
         sys.exit(1)
 
 
-def unzip_and_check_polygon_package(zip_file, polygon_folder):
+def open_polygon_package(zip_file):
     """
-    Extracts a polygon package from a ZIP file and checks for required files within the extracted contents.
+    Opens a polygon package ZIP file and checks for the required files within it, without extracting anything.
 
     Args:
-    zip_file (str): The path to the ZIP file containing the polygon package.
-    polygon_folder (str): The directory where the ZIP file will be extracted to.
-
-    This function checks for the existence of specific required files after extraction and raises an exception if any
-    files are missing. This ensures the package's integrity and readiness for further processing.
-    """
-    required_files = [
-        '/check.cpp',
-        '/files/testlib.h',
-        '/problem.xml',
-        '/statements/.pdf/portuguese/problem.pdf'
-    ]
+    zip_file (str or file): The path to the ZIP file containing the polygon package, or a seekable binary file object.
+
+    Returns:
+    ZipFile: The opened package. Members are read straight from it while the BOCA package is written.
+
+    This function checks the central directory of the ZIP file for specific required files and raises an exception if
+    any files are missing. This ensures the package's integrity and readiness for further processing.
+    """
     try:
-        # Extract the ZIP file to the designated folder
-        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-            zip_ref.extractall(polygon_folder)
-
-        # Check for the existence of all required files in the extracted folder
-        for file in required_files:
-            if not os.path.exists(polygon_folder + file):
-                raise Exception(f"Required file '{file}' not found in the ZIP package.")
-    except zipfile.BadZipFile:
-        print("Error: Bad ZIP file.")
-        sys.exit(1)
-    except FileNotFoundError:
-        print("Error: File", zip_file, "not found.")
-        sys.exit(1)
+        zip_ref = zipfile.ZipFile(zip_file, 'r')
+
+        # Check for the existence of all required files in the ZIP file
+        names = set(zip_ref.namelist())
+        for file in REQUIRED_FILES:
+            if file not in names:
+                zip_ref.close()
+                raise Exception(f"Required file '/{file}' not found in the ZIP package.")
+        return zip_ref
+    except zipfile.BadZipFile as e:
+        raise PackageError("Bad ZIP file.") from e
+    except FileNotFoundError as e:
+        raise PackageError(f"File {zip_file} not found.") from e
     except Exception as e:
-        print("Error:", e)
-        sys.exit(1)
+        raise PackageError(str(e)) from e
 
 
-def backup(source, target, problem_idx):
+def list_backups(target, problem_idx):
+    """
+    Lists the backup snapshots of a problem in the target directory, from the oldest to the newest.
+
+    Returns:
+    list of str: The paths of the snapshots.
+    """
+    if not os.path.isdir(target):
+        return []
+    prefix = 'Problem_' + problem_idx + '_'
+    snapshots = []
+    for name in os.listdir(target):
+        path = os.path.join(target, name)
+        if name.startswith(prefix) and os.path.isdir(path):
+            # Names are Problem_X_<date>_<time>, with a _<n> suffix for backups made within the same second
+            parts = name[len(prefix):].split('_')
+            suffix = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 1
+            snapshots.append(('_'.join(parts[:2]), suffix, path))
+    return [path for _, _, path in sorted(snapshots)]
+
+
+def clone_file(source, target):
+    """
+    Copies a file with its metadata, as a reflink sharing the data blocks of source when the file system supports it.
+    """
+    if fcntl is not None:
+        try:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            copystat(source, target)
+            return
+        except OSError:
+            pass
+    copy2(source, target)
+
+
+def read_index(index_file):
+    """Reads a file index (see package_index) written by make_problem or backup, or returns None when it can not."""
+    try:
+        with open(index_file) as index:
+            return json.load(index)
+    except (OSError, ValueError):
+        return None
+
+
+def backup_index_file(backup_folder):
+    """Returns the path of the file index kept next to a backup folder (see backup)."""
+    parent, name = os.path.split(backup_folder)
+    return os.path.join(parent, '.' + name + '.index')
+
+
+def unpacked_entry(index, index_time, name, file_stat):
+    """
+    Returns the entry of a file in the index written when its package was unpacked (see backup), or None when the
+    file is not listed or was modified since, judging by its size, permissions and modification time.
+    """
+    entry = index.get(name) if index is not None else None
+    if entry is None or file_stat.st_size != entry[1] or file_stat.st_mode & 0o777 != entry[2] \
+            or file_stat.st_mtime_ns > index_time:
+        return None
+    return entry
+
+
+def estimate_backup_size(source, target, problem_idx, store=None, index_file=None):
+    """
+    Estimates the bytes backup(source, target, problem_idx, store=store, index_file=index_file) writes, without
+    reading any file.
+
+    Files the indexes show unchanged since the previous backup, and files that are already links to blobs of the
+    store, are linked instead of written; files that would only be found unchanged by reading them are counted.
+
+    Returns:
+    dict: The bytes written to each folder, target or the store, keyed by folder path.
+    """
+    index = read_index(index_file) if index_file is not None else None
+    index_time = os.stat(index_file).st_mtime_ns if index is not None else None
+    previous_backups = list_backups(target, problem_idx)
+    previous_index = (read_index(backup_index_file(previous_backups[-1])) if previous_backups else None) or {}
+    needed = {}
+    for root, _, files in os.walk(source):
+        for file in files:
+            source_file = os.path.join(root, file)
+            name = os.path.relpath(source_file, source).replace(os.sep, '/')
+            file_stat = os.stat(source_file)
+            entry = unpacked_entry(index, index_time, name, file_stat)
+            if store is not None and blob_store.can_store(file_stat.st_mode):
+                if not blob_store.is_blob_link(file_stat):
+                    needed[store] = needed.get(store, 0) + file_stat.st_size
+            elif entry is None or previous_index.get(name) != entry:
+                needed[target] = needed.get(target, 0) + file_stat.st_size
+    return needed
+
+
+def backup(source, target, problem_idx, max_snapshots=None, store=None, index_file=None):
     """
     Backs up the contents of a source directory to a target directory.
 
@@ -184,12 +471,27 @@ def backup(source, target, problem_idx):
     Args:
     source (str): The path to the source directory whose contents are to be backed up.
     target (str): The path to the target directory where the backup will be stored.
+    problem_idx (str): The problem letter, used to name the backup folder.
+    max_snapshots (int): When given, only the newest max_snapshots backups of the problem are kept.
+    store (str): When given, the folder of a blob store (see blob_store.py). Files it can hold are backed up as hard
+    links to its blobs, so a file is stored once however many backups, packages and problems have it.
+    index_file (str): When given, the index (see package_index) written when source was unpacked.
 
-    The function uses the current date and time to create a unique folder for each backup. If the exact folder name 
-    is already taken, it appends a number to create a unique path. Errors during the backup process are caught, 
-    and an error message is printed followed by exiting the script.
+    Returns:
+    int: The number of files backed up.
+
+    Files that did not change since the previous backup of the problem are hard links to the files of that backup,
+    so unchanged tests take no space. The CRC, size and permissions of the files are kept in an index next to each
+    backup folder, so a file that index_file lists and that was not modified since it was unpacked is recognized as
+    unchanged from the indexes alone, without being read; other files are compared with the previous backup byte by
+    byte. Changed files are reflinked where the file system supports it, and copied otherwise. The function uses the
+    current date and time to create a unique folder for each backup. If the exact folder name is already taken, it
+    appends a number to create a unique path. Errors during the backup process are raised as PackageError.
     """
     try:
+        previous_backups = list_backups(target, problem_idx)
+        previous_backup = previous_backups[-1] if previous_backups else None
+
         current_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         backup_folder = target + '/Problem_' + problem_idx + '_' + current_date
         if os.path.exists(backup_folder):
@@ -197,47 +499,159 @@ def backup(source, target, problem_idx):
             while os.path.exists(backup_folder + '_' + str(it)):
                 it += 1
             backup_folder = backup_folder + '_' + str(it)
-        copytree(source, backup_folder)
+
+        index = read_index(index_file) if index_file is not None else None
+        index_time = os.stat(index_file).st_mtime_ns if index is not None else None
+        previous_index = (read_index(backup_index_file(previous_backup)) if previous_backup else None) or {}
+        backup_index = {}
+
+        backed_up = 0
+        for root, _, files in os.walk(source):
+            relative_root = os.path.relpath(root, source)
+            os.makedirs(os.path.join(backup_folder, relative_root), exist_ok=True)
+            for file in files:
+                backed_up += 1
+                source_file = os.path.join(root, file)
+                backup_file = os.path.join(backup_folder, relative_root, file)
+                name = os.path.relpath(source_file, source).replace(os.sep, '/')
+                source_stat = os.stat(source_file)
+                entry = unpacked_entry(index, index_time, name, source_stat)
+                blob = None
+                if store is not None:
+                    # A file unpacked from the store is already a link to its blob, and is linked without hashing it
+                    if blob_store.is_blob_link(source_stat):
+                        blob = source_file
+                    else:
+                        blob = blob_store.add_file(store, source_file)
+                if blob is not None:
+                    blob_store.link_blob(blob, backup_file)
+                    if entry is not None:
+                        backup_index[name] = entry
+                    continue
+                previous_file = os.path.join(previous_backup, relative_root, file) if previous_backup else None
+                if previous_file and os.path.isfile(previous_file):
+                    previous_stat = os.stat(previous_file)
+                    if entry is not None and name in previous_index:
+                        unchanged = previous_index[name] == entry and previous_stat.st_size == entry[1]
+                    else:
+                        unchanged = previous_stat.st_size == source_stat.st_size and \
+                            previous_stat.st_mode == source_stat.st_mode and \
+                            filecmp.cmp(previous_file, source_file, shallow=False)
+                        entry = entry or (previous_index.get(name) if unchanged else None)
+                    if unchanged:
+                        try:
+                            os.link(previous_file, backup_file)
+                            if entry is not None:
+                                backup_index[name] = entry
+                            continue
+                        except OSError:
+                            pass  # e.g. too many links to the same file, fall back to a copy
+                clone_file(source_file, backup_file)
+                if entry is not None:
+                    backup_index[name] = entry
+            copystat(root, os.path.join(backup_folder, relative_root))
+        with open(backup_index_file(backup_folder), 'w') as backup_index_out:
+            json.dump(backup_index, backup_index_out)
+
+        if max_snapshots is not None:
+            for old_backup in list_backups(target, problem_idx)[:-max_snapshots]:
+                rmtree(old_backup)
+                if os.path.exists(backup_index_file(old_backup)):
+                    os.remove(backup_index_file(old_backup))
+        return backed_up
     except Exception as e:
-        print("Error:", e)
-        sys.exit(1)
+        raise PackageError(str(e)) from e
 
 
-def make_inputs_outputs(xml_root, problem_folder, polygon_folder):
+def parse_problem_xml(polygon_zip):
     """
-    Copies input and output files from polygon_folder based on configurations in xml_root to problem_folder.
+    Parses problem.xml up to the end of its judging section.
+
+    The names and the testsets, all the BOCA package needs, come first in problem.xml, so the rest of the file (files,
+    assets, properties, stresses and tags) is neither decompressed nor parsed: the XML is fed to a pull parser in
+    chunks until it reports the end of the judging element under the root. Files without one are parsed whole.
 
     Args:
-    xml_root (ElementTree): The XML root element containing problem configuration.
-    problem_folder (str): The destination folder for organized input and output files.
-    polygon_folder (str): The source folder containing unorganized test cases.
+    polygon_zip (ZipFile): The opened polygon package.
+
+    Returns:
+    Element: The root of problem.xml, holding the elements up to the judging section.
+    """
+    try:
+        parser = eT.XMLPullParser(events=('start', 'end'))
+        root = None
+        depth = 0
+        with polygon_zip.open('problem.xml') as xml_file:
+            for chunk in iter(lambda: xml_file.read(XML_CHUNK_SIZE), b''):
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    if event == 'start':
+                        root = element if root is None else root
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth == 1 and element.tag == 'judging':
+                        del root[list(root).index(element) + 1:]  # partly parsed from the rest of the chunk
+                        return root
+        parser.close()  # raises on a truncated file
+        return root
+    except eT.ParseError as e:
+        raise PackageError(f"Invalid problem.xml: {e}") from e
+
+
+def index_tests(testset, names):
+    """
+    Lists the tests of a testset, in test order.
+
+    The tests are taken from the test count and the input and answer path patterns that problem.xml declares. Packages
+    without them are indexed by scanning the testset folder for answer files instead.
+
+    Args:
+    testset (Element): The testset element of problem.xml.
+    names (set): The member names of the polygon package.
+
+    Returns:
+    list of tuple: The input and answer member names of each test.
+    """
+    count = testset.findtext('test-count')
+    input_pattern = testset.findtext('input-path-pattern')
+    answer_pattern = testset.findtext('answer-path-pattern')
+    if count is not None and input_pattern and answer_pattern:
+        return [(input_pattern % idx, answer_pattern % idx) for idx in range(1, int(count) + 1)]
+
+    prefix = testset.attrib['name'] + '/'
+    return [(name[:-2], name) for name in sorted(names)
+            if name.startswith(prefix) and '/' not in name[len(prefix):] and name.endswith('.a')]
+
+
+def make_inputs_outputs(xml_root, members, polygon_zip):
     """
-    # Extract all testsets directories from XML
-    test_dirs = [element.attrib['name'] for element in xml_root.find('judging').findall('testset')]
+    Adds the input and output files of the testsets in xml_root to the package members.
 
+    Args:
+    xml_root (ElementTree): The XML root element containing problem configuration.
+    members (dict): The package members being assembled (see write_package).
+    polygon_zip (ZipFile): The opened polygon package containing unorganized test cases.
+    """
     try:
-        # Iterate over each directory and process files
-        for idx, test_dir in enumerate(test_dirs, start=1):
-            test_dir_path = str(os.path.join(polygon_folder, test_dir))
-            if os.path.isdir(test_dir_path):
-                for filename in os.listdir(test_dir_path):
-                    if filename.endswith('.a'):  # Identify output files
-                        input_filename = filename[:-2]  # Corresponding input file name
+        names = set(polygon_zip.namelist())
 
-                        if not os.path.exists(os.path.join(test_dir_path, input_filename)):
-                            raise FileNotFoundError(f"Input file '{input_filename}' not found in {test_dir}.")
+        for idx, testset in enumerate(xml_root.find('judging').findall('testset'), start=1):
+            tests = index_tests(testset, names)
 
-                        # Define target paths for input and output files
-                        output_file_path = os.path.join(problem_folder, 'output', f"{input_filename}.{idx}")
-                        input_file_path = os.path.join(problem_folder, 'input', f"{input_filename}.{idx}")
+            # Check every test file at once, so a broken package reports all of its missing files
+            missing = [name for test in tests for name in test if name not in names]
+            if missing:
+                shown = ', '.join(missing[:10]) + (f" and {len(missing) - 10} more" if len(missing) > 10 else "")
+                raise FileNotFoundError(f"Test files missing from testset {testset.attrib['name']}: {shown}.")
 
-                        # Copy output and then input files to their respective directories
-                        copy(os.path.join(test_dir_path, filename), output_file_path)
-                        copy(os.path.join(test_dir_path, input_filename), input_file_path)
+            for input_name, answer_name in tests:
+                test_name = input_name.rsplit('/', 1)[-1]
+                members[f"output/{test_name}.{idx}"] = ('polygon', answer_name)
+                members[f"input/{test_name}.{idx}"] = ('polygon', input_name)
 
     except Exception as e:
-        print("Error:", e)
-        sys.exit(1)
+        raise PackageError(str(e)) from e
 
 
 def get_limits(xml_root):
@@ -259,22 +673,13 @@ def get_limits(xml_root):
         time_limit_milliseconds = int(testset.find('time-limit').text)
         memory_limit = int(testset.find('memory-limit').text) // (1024 ** 2)  # Convert to MB
 
-        # Using gcd to compute lcm
-        gcd_time = gcd(1000, time_limit_milliseconds)
-        clang_timelimit = (1000 * time_limit_milliseconds) // gcd_time
-        repetitions = clang_timelimit // time_limit_milliseconds
-        clang_timelimit //= 1000  # Convert milliseconds to seconds
-
-        if clang_timelimit > 10:
-            print(f"[WARNING] Problem with time limit greater than 10 seconds for C/C++!")
+        clang_timelimit, repetitions = split_timelimit(time_limit_milliseconds)
 
         return clang_timelimit, repetitions, memory_limit
     except ValueError as ve:
-        print("Error in processing limits:", ve)
-        sys.exit(1)
+        raise PackageError(f"Invalid limits: {ve}") from ve
     except Exception as e:
-        print("Error:", e)
-        sys.exit(1)
+        raise PackageError(str(e)) from e
 
 
 def get_problem_name(xml_root):
@@ -287,37 +692,29 @@ def get_problem_name(xml_root):
     Returns:
     str: The name of the problem either in English or Portuguese.
 
-    The function searches for the problem name first in English and then in Portuguese.
+    The function takes the Portuguese name, or the English one when there is none.
     If no name is found, it raises a ValueError.
     """
     try:
-        problem_name = None
-        for name_element in xml_root.findall('.//names/name'):
-            if name_element.attrib.get('language') == 'english':
-                problem_name = name_element.attrib.get('value')
-                break
-
-        for name_element in xml_root.findall('.//names/name'):
-            if name_element.attrib.get('language') == 'portuguese':
-                problem_name = name_element.attrib.get('value')
-                break
+        names = {name_element.get('language'): name_element.get('value')
+                 for name_element in xml_root.iterfind('names/name')}
+        problem_name = names.get('portuguese', names.get('english'))
         if problem_name is None:
             raise ValueError("Problem name not found in the XML file.")
         problem_name = problem_name.replace(r'\&', '&')
         return problem_name
     except Exception as e:
-        print("Error:", e)
-        sys.exit(1)
+        raise PackageError(str(e)) from e
 
 
-def make_description(polygon_folder, xml_root, problem_folder, problem_idx):
+def make_description(polygon_zip, xml_root, members, problem_idx):
     """
-    Creates a problem description file and copies the problem statement PDF.
+    Creates a problem description file and adds the problem statement PDF.
 
     Args:
-    polygon_folder (str): Source folder containing the problem's assets.
+    polygon_zip (ZipFile): The opened polygon package containing the problem's assets.
     xml_root (Element): The XML root element containing problem configuration.
-    problem_folder (str): Destination folder where the problem's description should be stored.
+    members (dict): The package members being assembled (see write_package).
     problem_idx (str): The problem index or identifier used to name files.
     """
     try:
@@ -325,155 +722,1249 @@ def make_description(polygon_folder, xml_root, problem_folder, problem_idx):
         problem_name = get_problem_name(xml_root)
 
         # Construct path to the problem statement PDF
-        problem_pdf_path = os.path.join(polygon_folder, 'statements', '.pdf', 'portuguese', 'problem.pdf')
-        if not os.path.exists(problem_pdf_path):
+        problem_pdf_path = 'statements/.pdf/portuguese/problem.pdf'
+        if problem_pdf_path not in polygon_zip.NameToInfo:
             raise FileNotFoundError("Portuguese problem statement PDF not found in the provided package.")
 
-        # Ensure description directory exists
-        description_folder = os.path.join(problem_folder, 'description')
+        # Create the problem.info file
+        problem_info = f'basename="{problem_idx}"\n'
+        problem_info += f'fullname="{problem_name}"\n'
+        problem_info += f'descfile="{problem_idx}.pdf"\n'
+        members['description/problem.info'] = ('data', problem_info.encode())
+
+        # Add the problem statement PDF to the description folder
+        members['description/' + problem_idx + '.pdf'] = ('polygon', problem_pdf_path)
+
+    except Exception as e:
+        raise PackageError(str(e)) from e
+
+
+def make_template(members):
+    """
+    Adds the scripts of the problem_template folder to the package members.
+
+    Args:
+    members (dict): The package members being assembled (see write_package).
+    """
+    for folder in sorted(os.listdir(TEMPLATE_FOLDER)):
+        for file in sorted(os.listdir(os.path.join(TEMPLATE_FOLDER, folder))):
+            members[folder + '/' + file] = ('file', os.path.join(TEMPLATE_FOLDER, folder, file))
+
+
+def member_data_offset(source_file, source_info):
+    """Returns the offset in source_file where the compressed data of a zip member starts, after its local header."""
+    source_file.seek(source_info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source_file.read(zipfile.sizeFileHeader))
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for member {source_info.filename}.")
+    return source_info.header_offset + zipfile.sizeFileHeader + header[10] + header[11]
+
+
+def copy_compressed_member(source_file, source_info, zip_out, member_info):
+    """
+    Copies a member of a zip file into zip_out as it is stored, without decompressing and compressing it again.
+
+    Args:
+    source_file (file): The source zip file, opened in binary mode.
+    source_info (ZipInfo): The member to copy, as listed in the central directory of the source zip file.
+    zip_out (ZipFile): The zip file being written.
+    member_info (ZipInfo): The name, date and permissions of the copied member in zip_out.
+
+    The compression method, CRC and sizes of the source member are reused, so the compressed bytes are copied as a
+    plain byte range. zipfile has no public API for this, so the member is added the same way ZipFile.open() adds
+    one when writing.
+    """
+    source_file.seek(member_data_offset(source_file, source_info))
+
+    member_info.compress_type = source_info.compress_type
+    member_info.CRC = source_info.CRC
+    member_info.compress_size = source_info.compress_size
+    member_info.file_size = source_info.file_size
+    member_info.flag_bits = 0
+
+    if zip_out._seekable:
+        zip_out.fp.seek(zip_out.start_dir)
+    member_info.header_offset = zip_out.fp.tell()
+    zip_out._writecheck(member_info)
+    zip_out._didModify = True
+    zip_out.fp.write(member_info.FileHeader())
+
+    remaining = source_info.compress_size
+    while remaining > 0:
+        chunk = source_file.read(min(COPY_BUFFER_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data for member {source_info.filename}.")
+        zip_out.fp.write(chunk)
+        remaining -= len(chunk)
+
+    zip_out.start_dir = zip_out.fp.tell()
+    zip_out.filelist.append(member_info)
+    zip_out.NameToInfo[member_info.filename] = member_info
+
+
+def can_copy_compressed(source_info):
+    """
+    Tells whether a member of the polygon package can be copied compressed into the BOCA package.
+
+    Only stored and deflated members that are not encrypted are copied as they are, since those are the methods any
+    zip reader (and BOCA) handles. Other members are decompressed and deflated again.
+    """
+    return source_info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) and not source_info.flag_bits & 0x1
+
+
+def deflate_chunk(chunk, level, zdict, last):
+    """
+    Compresses one chunk of a member as a piece of its raw deflate stream, the way pigz does.
+
+    Every chunk but the last ends with a sync flush, which aligns the output to a byte boundary without ending the
+    stream, so the compressed chunks of a member can be concatenated in order. Compressing with the end of the
+    previous chunk as the dictionary keeps the result close in size to deflating the member in one piece.
+    """
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def queue_member(pool, pending, zip_out, member_info, source, level, window):
+    """
+    Reads a member chunk by chunk and queues it to be written to zip_out, compressing the chunks on a thread pool.
+
+    Args:
+    pool (ThreadPoolExecutor): Compresses the chunks. zlib releases the GIL, so they are compressed in parallel.
+    pending (deque): The writes to zip_out not done yet, in order (see write_pending).
+    zip_out (ZipFile): The zip file being written.
+    member_info (ZipInfo): The name, date, permissions and expected size of the member.
+    source (file): The content of the member, opened in binary mode.
+    level (int or str): The zlib compression level, or STORE_LEVEL.
+    window (int): Queued writes are done as soon as more than this many are pending, which bounds the memory used.
+    """
+    member_info.compress_type = zipfile.ZIP_STORED if level == STORE_LEVEL else zipfile.ZIP_DEFLATED
+    zip64 = member_info.file_size * 1.05 > zipfile.ZIP64_LIMIT  # the same guess ZipFile.open() makes
+    pending.append(('start', member_info, zip64))
+
+    crc = 0
+    size = 0
+    previous = b''
+    chunk = source.read(COMPRESS_CHUNK_SIZE)
+    while True:
+        following = source.read(COMPRESS_CHUNK_SIZE)
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        if level == STORE_LEVEL:
+            pending.append(('data', member_info, chunk))
+        else:
+            zdict = previous[-DEFLATE_WINDOW_SIZE:]
+            pending.append(('data', member_info, pool.submit(deflate_chunk, chunk, level, zdict, not following)))
+        write_pending(zip_out, pending, window)
+        if not following:
+            break
+        previous, chunk = chunk, following
+
+    pending.append(('end', member_info, zip64, crc, size))
+
+
+def write_pending(zip_out, pending, keep=0):
+    """
+    Does the queued writes of members to zip_out in order, until at most keep writes are left pending.
+
+    A member is added the same way ZipFile.open() adds one to a seekable file: its local header is written before
+    its data, and written again with the final CRC and sizes once its data is written. zipfile has no public API for
+    writing data compressed elsewhere, hence the use of its internals.
+    """
+    while len(pending) > keep:
+        entry = pending.popleft()
+        if entry[0] == 'start':
+            _, member_info, zip64 = entry
+            member_info.flag_bits = 0
+            member_info.CRC = 0
+            member_info.compress_size = 0
+            zip_out.fp.seek(zip_out.start_dir)
+            member_info.header_offset = zip_out.start_dir
+            zip_out._writecheck(member_info)
+            zip_out._didModify = True
+            zip_out.fp.write(member_info.FileHeader(zip64))
+        elif entry[0] == 'data':
+            _, member_info, data = entry
+            if isinstance(data, Future):
+                data = data.result()
+            zip_out.fp.write(data)
+            member_info.compress_size += len(data)
+        else:
+            _, member_info, zip64, crc, size = entry
+            if not zip64 and max(size, member_info.compress_size) > zipfile.ZIP64_LIMIT:
+                raise RuntimeError(f"Member {member_info.filename} grew past the zip64 limit while being written.")
+            member_info.CRC = crc
+            member_info.file_size = size
+            end = zip_out.fp.tell()
+            zip_out.fp.seek(member_info.header_offset)
+            zip_out.fp.write(member_info.FileHeader(zip64))
+            zip_out.fp.seek(end)
+            zip_out.filelist.append(member_info)
+            zip_out.NameToInfo[member_info.filename] = member_info
+        zip_out.start_dir = zip_out.fp.tell()
+
+
+def estimate_package_size(polygon_zip, members, raw_copy=True):
+    """
+    Estimates the disk space a package takes from the central directory of the polygon package, reading no member.
+
+    Args:
+    polygon_zip (ZipFile): The opened polygon package that 'polygon' members are read from.
+    members (dict): The package members (see write_package).
+    raw_copy (bool): Whether the compressed members of the polygon package are copied as they are.
+
+    Returns:
+    tuple: Upper bounds of the size of the zip file and of the unpacked package, in bytes.
+    """
+    zip_size = ZIP_END_SIZE + len(PACKAGE_FOLDERS) * ZIP_ENTRY_SIZE
+    package_size = 0
+    for name, (kind, source) in members.items():
+        if kind == 'polygon':
+            source_info = polygon_zip.getinfo(source)
+            file_size = source_info.file_size
+            stored_size = source_info.compress_size if raw_copy and can_copy_compressed(source_info) else None
+        else:
+            file_size = os.path.getsize(source) if kind == 'file' else len(source)
+            stored_size = None
+        if stored_size is None:
+            # Deflate grows incompressible data by a few bytes per block, and each chunk adds a sync flush marker
+            stored_size = file_size + file_size // 1000 + 64
+        zip_size += stored_size + ZIP_ENTRY_SIZE + 2 * len(name)
+        package_size += file_size
+    return zip_size, package_size
+
+
+def check_disk_space(needed, disk_budget=None):
+    """
+    Checks that the folders a build writes to have room for it, so it fails before writing anything.
+
+    Args:
+    needed (dict): The bytes that will be written to each folder, keyed by folder path.
+    disk_budget (int): When given, the build may not write more than this many megabytes in total, even if the
+    disks have room for more.
+
+    Folders on the same file system share its free space. Raises PackageError with the estimate when the build does
+    not fit.
+    """
+    try:
+        total = sum(needed.values())
+        if disk_budget is not None and total > disk_budget * 1024 ** 2:
+            raise RuntimeError(f"The build needs about {total / 1024 ** 2:.1f} MB of disk space "
+                               f"({format_space(needed)}), over the budget of {disk_budget} MB.")
+        devices = {}
+        for folder, size in needed.items():
+            device = os.stat(folder).st_dev
+            devices.setdefault(device, [folder, 0])[1] += size
+        for folder, size in devices.values():
+            free = disk_usage(folder).free
+            if size > free:
+                raise RuntimeError(f"The build needs about {size / 1024 ** 2:.1f} MB of disk space "
+                                   f"({format_space(needed)}), but only {free / 1024 ** 2:.1f} MB are free on the "
+                                   f"file system of {folder}/.")
+    except Exception as e:
+        raise PackageError(str(e)) from e
+
 
-        # Create and write to the problem.info file
-        info_file_path = os.path.join(description_folder, 'problem.info')
-        with open(info_file_path, 'w') as problem_info_file:
-            print(f'basename="{problem_idx}"', file=problem_info_file)
-            print(f'fullname="{problem_name}"', file=problem_info_file)
-            print(f'descfile="{problem_idx}.pdf"', file=problem_info_file)
+def format_space(needed):
+    """Describes the space needed in each folder, as "X MB in folder/, ..."."""
+    return ', '.join(f"{size / 1024 ** 2:.1f} MB in {folder}/" for folder, size in needed.items() if size)
 
-        # Copy the problem statement PDF to the description folder
-        copy(problem_pdf_path, description_folder + '/' + problem_idx + '.pdf')
 
+def write_package(output_file, polygon_zip, members, raw_copy=True, metrics=None,
+                  compression_level=zlib.Z_DEFAULT_COMPRESSION, threads=None, memory_budget=None):
+    """
+    Writes the BOCA package zip file, streaming every member from its source.
+
+    Args:
+    output_file (str or file): The path of the zip file to write, or a seekable binary file object.
+    polygon_zip (ZipFile): The opened polygon package that 'polygon' members are read from.
+    members (dict): The package members, keyed by their path inside the BOCA package. Each value is a
+    (kind, source) tuple, where kind is 'polygon' (source is a member name of polygon_zip), 'file' (source is a
+    path on disk) or 'data' (source is the content as bytes).
+    raw_copy (bool): Copy the already compressed members of the polygon package as they are. When False, they are
+    decompressed and compressed again.
+    metrics (dict): When given, receives the counters of writing each kind of member, under
+    write_zip.<file|data|copy_compressed|recompress> (see measure_stage). Since members are compressed in the
+    background, these count reading and queueing them.
+    compression_level (int or str): The zlib level the members are compressed with, or STORE_LEVEL to store them.
+    threads (int): Number of threads compressing members, the number of CPUs by default.
+    memory_budget (int): When given, bounds the memory taken by chunks being compressed to about this many megabytes,
+    using fewer threads if needed. Each chunk in flight takes up to twice COMPRESS_CHUNK_SIZE.
+
+    The folder entries of the package are written first, followed by the members sorted by name. Every entry gets the
+    same timestamp and permissions (ZIP_DATE_TIME, and FILE_MODE or EXECUTABLE_MODE), so the same members always give
+    the same zip file, whatever the order they were added in or the dates of the source files. Nothing is
+    staged on disk: members of the polygon package are either copied compressed, or decompressed and compressed again
+    chunk by chunk. Members are compressed in chunks on a thread pool and written in order as their chunks finish.
+    """
+    threads = threads or os.cpu_count() or 1
+    window = 2 * threads
+    if memory_budget is not None:
+        window = max(1, min(window, memory_budget * 1024 ** 2 // (2 * COMPRESS_CHUNK_SIZE)))
+        threads = min(threads, window)
+    try:
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zip_out, \
+                ThreadPoolExecutor(threads) as pool:
+            pending = deque()
+            for folder in PACKAGE_FOLDERS:
+                folder_info = zipfile.ZipInfo(folder + '/', ZIP_DATE_TIME)
+                folder_info.external_attr = (stat.S_IFDIR | EXECUTABLE_MODE) << 16 | 0x10  # MS-DOS directory flag
+                zip_out.writestr(folder_info, b'')
+
+            for name in sorted(members):
+                kind, source = members[name]
+                if kind == 'file':
+                    with measure_stage(metrics, 'write_zip.file') as stage:
+                        member_info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+                        mode = EXECUTABLE_MODE if os.stat(source).st_mode & 0o111 else FILE_MODE
+                        member_info.external_attr = (stat.S_IFREG | mode) << 16
+                        member_info.file_size = os.path.getsize(source)
+                        with open(source, 'rb') as src:
+                            queue_member(pool, pending, zip_out, member_info, src, compression_level, window)
+                        stage['files'] = 1
+                elif kind == 'data':
+                    with measure_stage(metrics, 'write_zip.data') as stage:
+                        member_info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+                        member_info.external_attr = (stat.S_IFREG | FILE_MODE) << 16
+                        member_info.file_size = len(source)
+                        queue_member(pool, pending, zip_out, member_info, io.BytesIO(source), compression_level,
+                                     window)
+                        stage['files'] = 1
+                elif kind == 'polygon':
+                    source_info = polygon_zip.getinfo(source)
+                    member_info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+                    member_info.external_attr = (stat.S_IFREG | FILE_MODE) << 16
+                    if raw_copy and can_copy_compressed(source_info):
+                        with measure_stage(metrics, 'write_zip.copy_compressed') as stage:
+                            write_pending(zip_out, pending)
+                            copy_compressed_member(polygon_zip.fp, source_info, zip_out, member_info)
+                            stage['files'] = 1
+                    else:
+                        with measure_stage(metrics, 'write_zip.recompress') as stage:
+                            member_info.file_size = source_info.file_size
+                            with polygon_zip.open(source_info) as src:
+                                queue_member(pool, pending, zip_out, member_info, src, compression_level, window)
+                            stage['files'] = 1
+                else:
+                    raise ValueError(f"Unknown source kind '{kind}' for package member {name}.")
+            write_pending(zip_out, pending)
+    except Exception as e:
+        raise PackageError(str(e)) from e
+
+
+def copy_stored_member(zip_file, member_info, path):
+    """
+    Writes a stored (uncompressed) zip member to path with copy_file_range, so its bytes are copied by the kernel.
+
+    Returns:
+    bool: False when copy_file_range is not available for these files, in which case nothing was written.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    offset = member_data_offset(zip_file, member_info)
+    with open(path, 'wb') as dst:
+        remaining = member_info.file_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(zip_file.fileno(), dst.fileno(), remaining, offset)
+                if not copied:
+                    raise zipfile.BadZipFile(f"Truncated data for member {member_info.filename}.")
+                offset += copied
+                remaining -= copied
+        except OSError as e:
+            if remaining != member_info.file_size or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL):
+                raise
+            return False
+    return True
+
+
+def package_index(zip_ref):
+    """Returns the CRC, size and permissions of each file of an opened zip file, keyed by member name."""
+    return {member_info.filename: [member_info.CRC, member_info.file_size, (member_info.external_attr >> 16) & 0o777]
+            for member_info in zip_ref.infolist() if not member_info.is_dir()}
+
+
+def package_manifest(zip_file):
+    """
+    Describes a BOCA package zip file: its size and SHA-256 digest, and the CRC-32 and size of each member.
+
+    Since the zip files are reproducible, the same manifest means the same package, so tools can compare manifests
+    to skip uploading or downloading a package again. Members are listed from the central directory, and only the
+    digest reads the whole file.
+
+    Args:
+    zip_file (str or file): The path of the zip file, or a seekable binary file object holding it.
+
+    Returns:
+    dict: The manifest.
+    """
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        members = {member_info.filename: {'crc32': f"{member_info.CRC:08x}", 'size': member_info.file_size}
+                   for member_info in zip_ref.infolist() if not member_info.is_dir()}
+    digest = hashlib.sha256()
+    size = 0
+    with (open(zip_file, 'rb') if isinstance(zip_file, str) else nullcontext(zip_file)) as package_file:
+        package_file.seek(0)
+        for chunk in iter(lambda: package_file.read(COPY_BUFFER_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return {'sha256': digest.hexdigest(), 'size': size, 'members': members}
+
+
+def write_manifest(zip_file, manifest_file):
+    """Writes the manifest of a package zip file (see package_manifest) as JSON, replacing any previous one."""
+    staging_manifest = manifest_file + '.tmp'
+    with open(staging_manifest, 'w') as manifest:
+        json.dump(package_manifest(zip_file), manifest, indent=2, sort_keys=True)
+    os.replace(staging_manifest, manifest_file)
+
+
+def extract_member(zip_ref, raw_zip, member_info, path, store=None):
+    """
+    Writes a file member of zip_ref to path, restoring its permissions. raw_zip is the same zip file, opened.
+
+    When store is given, members that are not executable are written as hard links to blobs of that blob store instead
+    (see blob_store.add_stream), so contents already in the store are not written again. Such files are read-only.
+    """
+    mode = (member_info.external_attr >> 16) & 0o777
+    if store is not None and blob_store.can_store(mode):
+        with zip_ref.open(member_info) as src:
+            blob_store.link_blob(blob_store.add_stream(store, src), path)
+        return
+    stored = member_info.compress_type == zipfile.ZIP_STORED and not member_info.flag_bits & 0x1
+    if not stored or not copy_stored_member(raw_zip, member_info, path):
+        with zip_ref.open(member_info) as src, open(path, 'wb') as dst:
+            copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    if mode:
+        os.chmod(path, mode)
+
+
+def extract_package(zip_file, folder, previous_index=None, store=None):
+    """
+    Unpacks a BOCA package zip file into a folder, restoring the permissions stored in the zip file.
+
+    Stored members are copied with copy_file_range; compressed ones are decompressed chunk by chunk.
+
+    Args:
+    zip_file (str): The path to the BOCA package zip file.
+    folder (str): The destination folder, created if needed.
+    previous_index (dict): The index (see package_index) of the package the folder already holds. When given, the
+    folder is updated in place: only the files whose CRC, size or permissions changed are written, each to a temporary
+    file that then replaces it, and the files no longer in the package are removed.
+    store (str): When given, the folder of a blob store the files are hard links to (see extract_member).
+
+    Returns:
+    tuple: The number of files written and the index of the unpacked package.
+    """
+    try:
+        files = 0
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref, open(zip_file, 'rb') as raw_zip:
+            index = package_index(zip_ref)
+            for member_info in zip_ref.infolist():
+                path = os.path.join(folder, member_info.filename)
+                if member_info.is_dir():
+                    ensure_dir_exists(path)
+                    continue
+                ensure_dir_exists(os.path.dirname(path))
+                if previous_index is None:
+                    extract_member(zip_ref, raw_zip, member_info, path, store)
+                else:
+                    unchanged = previous_index.get(member_info.filename) == index[member_info.filename]
+                    if unchanged and os.path.isfile(path) and os.path.getsize(path) == member_info.file_size:
+                        continue
+                    temp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+                    extract_member(zip_ref, raw_zip, member_info, temp_path, store)
+                    os.replace(temp_path, path)
+                files += 1
+
+        for name in set(previous_index or ()) - set(index):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                os.remove(path)
+        return files, index
+    except Exception as e:
+        raise PackageError(str(e)) from e
+
+
+def compile_cached(sources, command, binary, binaries_folder):
+    """
+    Compiles a program, reusing the binary of a previous compilation of the same sources.
+
+    Args:
+    sources (dict): The content of each source file as bytes, keyed by file name.
+    command (list of str): The compiler command line, run in a folder holding the sources.
+    binary (str): The name of the file produced by the command.
+    binaries_folder (str): The folder compiled binaries are kept in, created if needed.
+
+    Returns:
+    str: The path of the binary, kept in binaries_folder under a hash of the sources, the command and the compiler
+    version, so identical programs (such as the standard Polygon checkers) are compiled once.
+    """
+    try:
+        digest = hashlib.sha256()
+        digest.update('\0'.join(command).encode())
+        digest.update(subprocess.run([command[0], '--version'], capture_output=True, check=True).stdout)
+        for name in sorted(sources):
+            digest.update(f"\0{name}\0".encode())
+            digest.update(sources[name])
+        cached_binary = os.path.join(binaries_folder, digest.hexdigest())
+        if os.path.exists(cached_binary):
+            try:
+                os.utime(cached_binary)  # marks the entry as recently used (see evict_cache)
+                return cached_binary
+            except FileNotFoundError:
+                pass  # evicted by a build running at the same time, so it is compiled again
+
+        ensure_dir_exists(binaries_folder)
+        with tempfile.TemporaryDirectory(prefix='boca_compile_') as build_folder:
+            for name, content in sources.items():
+                with open(os.path.join(build_folder, name), 'wb') as source_file:
+                    source_file.write(content)
+            result = subprocess.run(command, cwd=build_folder, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"Compilation failed: {' '.join(command)}\n{result.stdout + result.stderr}")
+            # Move the binary in place atomically, builds running at the same time may compile the same program
+            staging_binary = tempfile.mkstemp(prefix='.' + binary + '_', dir=binaries_folder)
+            os.close(staging_binary[0])
+            copy2(os.path.join(build_folder, binary), staging_binary[1])
+            os.replace(staging_binary[1], cached_binary)
+        return cached_binary
     except FileNotFoundError as e:
-        print("File not found error:", e)
-        sys.exit(1)
-    except IOError as e:
-        print("IO error:", e)
-        sys.exit(1)
+        raise PackageError(f"Compiler {command[0]} not found.") from e
     except Exception as e:
-        print("Unexpected error:", e)
-        sys.exit(1)
+        raise PackageError(str(e)) from e
+
+
+def compile_checker(polygon_zip, binaries_folder):
+    """
+    Compiles the checker of the polygon package against its testlib.h, keeping the binary in binaries_folder.
+
+    Returns:
+    str: The path of the checker binary (see compile_cached).
+    """
+    sources = {
+        'check.cpp': polygon_zip.read('check.cpp'),
+        'testlib.h': polygon_zip.read('files/testlib.h')
+    }
+    return compile_cached(sources, CHECKER_COMPILE_COMMAND, 'check', binaries_folder)
+
+
+def compile_fast_comparator(binaries_folder):
+    """
+    Compiles tools/fastcmp.c, the single-pass comparator used by the compare scripts when there is no checker,
+    keeping the binary in binaries_folder.
+
+    Returns:
+    str: The path of the comparator binary (see compile_cached).
+    """
+    with open(os.path.join(TOOLS_FOLDER, 'fastcmp.c'), 'rb') as source_file:
+        sources = {'fastcmp.c': source_file.read()}
+    return compile_cached(sources, FAST_COMPARATOR_COMPILE_COMMAND, 'fastcmp', binaries_folder)
+
 
+def build_cache_key(file_name, problem_idx, settings):
+    """
+    Computes the build cache key of a problem: a hash of everything that determines the BOCA package.
+
+    Args:
+    file_name (str): The path to the Polygon package zip file.
+    problem_idx (str): The problem letter.
+    settings (list): The time limit factors and build options that change the package content.
 
-def check_run_directory():
+    The key covers the content of the Polygon package, the problem letter, the settings, the problem_template scripts,
+    the tools folder and this script itself, so changing any of them results in a rebuild.
+
+    Returns:
+    str: The hexadecimal SHA-256 digest.
     """
-    Ensures that the script is run from its own directory. Exits the program if it is not.
+    digest = hashlib.sha256()
+    digest.update(repr([problem_idx] + list(settings)).encode())
+    with open(file_name, 'rb') as package_file:
+        for chunk in iter(lambda: package_file.read(COPY_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    for folder in ['problem_template/' + name for name in sorted(os.listdir(TEMPLATE_FOLDER))] + ['tools']:
+        for file in sorted(os.listdir(os.path.join(SCRIPT_FOLDER, folder))):
+            digest.update(f"\0{folder}/{file}\0".encode())
+            with open(os.path.join(SCRIPT_FOLDER, folder, file), 'rb') as source_file:
+                digest.update(source_file.read())
+    with open(os.path.abspath(__file__), 'rb') as script_file:
+        digest.update(script_file.read())
+    return digest.hexdigest()
+
+
+def link_or_copy(source, target):
     """
+    Makes target a hard link to source, falling back to a copy when the file system does not allow it.
+    """
+    if os.path.exists(target):
+        os.remove(target)
     try:
-        # Get the current working directory
-        current_directory = os.getcwd()
+        os.link(source, target)
+    except OSError:
+        copy(source, target)
 
-        # Get the absolute directory of the script
-        script_directory = os.path.dirname(os.path.abspath(__file__))
 
-        # Compare both paths and raise an exception if they do not match
-        if current_directory != script_directory:
-            raise EnvironmentError("The script must be run from the folder it is located in.")
+def evict_cache(cache_folder, max_size_mb, max_age_days):
+    """
+    Removes cache entries not used for more than max_age_days, then the least recently used ones until the cache
+    takes at most max_size_mb megabytes.
 
-    except EnvironmentError as e:
-        print("Error:", e)
-        sys.exit(1)
+    The entries are the cached packages and the files of the binaries (compiled checkers and comparators) and
+    metadata subfolders. Files still being written, which are named with a leading dot or a .tmp suffix, are left
+    alone.
+    """
+    entries = []
+    for folder in (cache_folder, os.path.join(cache_folder, 'binaries'), os.path.join(cache_folder, 'metadata')):
+        try:
+            for entry in os.scandir(folder):
+                if entry.name.startswith('.') or entry.name.endswith('.tmp') or not entry.is_file():
+                    continue
+                if folder == cache_folder and not entry.name.endswith('.zip'):
+                    continue
+                entry_stat = entry.stat()
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass  # nothing cached there yet, or removed by another build running at the same time
+    entries.sort()
+
+    oldest_allowed = time.time() - max_age_days * 24 * 60 * 60
+    total_size = sum(size for _, size, _ in entries)
+    for last_used, size, path in entries:
+        if last_used >= oldest_allowed and total_size <= max_size_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # another build running at the same time removed the same entry
+        total_size -= size
+
+
+def read_process_io():
+    """Returns the I/O counters of the current process from /proc/self/io, or an empty dict if unavailable."""
+    try:
+        with open('/proc/self/io') as io_file:
+            return {key: int(value) for key, value in (line.split(': ') for line in io_file)}
+    except OSError:
+        return {}
 
 
-def create_workspace(problem_idx):
+def cpu_time():
     """
-    Creates an isolated temporary workspace for a single conversion run.
+    Returns the CPU time used by this process and its finished child processes (such as compilers), in seconds. The
+    child processes are left out where their usage is not available.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    temp_root = tempfile.mkdtemp(prefix=f"boca_problem_{problem_idx}_{timestamp}_", dir='/tmp')
-    problem_folder = temp_root + "/Problem_" + problem_idx
-    polygon_folder = temp_root + '/polygon_package'
-    os.makedirs(problem_folder)
-    os.makedirs(polygon_folder)
-    return temp_root, problem_folder, polygon_folder
+    if resource is None:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
 
 
-if __name__ == '__main__':
+@contextmanager
+def measure_stage(metrics, name, members=None):
     """
-    Main entry point of the script. Parses command line arguments, performs initial setup,
-    and orchestrates the execution of the main functionalities of the script.
+    Measures a build stage: wall time, CPU time, bytes read and written through system calls, and files produced.
 
-    The script processes a polygon package based on the provided problem identifier and zip file,
-    applying configurations and preparing it for a competitive programming environment.
+    Args:
+    metrics (dict): Receives the counters of the stage under the stage name, added to those of previous runs of the
+    same stage. Nothing is measured when it is None.
+    name (str): The stage name.
+    members (dict): When given, the package members added or replaced during the stage are counted as files
+    produced.
+
+    Yields:
+    dict: The counters of this run of the stage. Stages that produce files outside the package members add them to
+    its 'files' entry.
+    """
+    stage = {'files': 0}
+    if metrics is None:
+        yield stage
+        return
+    members_before = dict(members) if members is not None else {}
+    io_before = read_process_io()
+    cpu_before = cpu_time()
+    start = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        io_after = read_process_io()
+        totals = metrics.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'bytes_read': 0, 'bytes_written': 0, 'files': 0})
+        totals['wall'] += time.perf_counter() - start
+        totals['cpu'] += cpu_time() - cpu_before
+        totals['bytes_read'] += io_after.get('rchar', 0) - io_before.get('rchar', 0)
+        totals['bytes_written'] += io_after.get('wchar', 0) - io_before.get('wchar', 0)
+        if members is not None:
+            stage['files'] += sum(members_before.get(name) is not source for name, source in members.items())
+        totals['files'] += stage['files']
+
+
+def merge_metrics(total, metrics):
+    """Adds the counters of each stage in metrics to those in total."""
+    for name, counters in metrics.items():
+        stage = total.setdefault(name, dict.fromkeys(counters, 0))
+        for key, value in counters.items():
+            stage[key] += value
+
+
+def format_metrics(metrics):
+    """
+    Formats build metrics as a table, one line per stage.
 
-    Command Line Arguments:
-    1. Problem Identifier (str): A single uppercase letter representing the problem.
-    2. Polygon Package (str): Path to the zip file containing the problem package.
-    3. Java Time Limit Factor (int, optional): Multiplier for the Java time limit relative to C/C++.
-    4. Python Time Limit Factor (int, optional): Multiplier for the Python time limit relative to C/C++.
+    Returns:
+    str: The table.
+    """
+    lines = [f"{'stage':<28}{'wall (s)':>10}{'cpu (s)':>10}{'read (MB)':>12}{'written (MB)':>14}{'files':>8}"]
+    for name, stage in metrics.items():
+        lines.append(f"{name:<28}{stage['wall']:>10.3f}{stage['cpu']:>10.3f}{stage['bytes_read'] / 1024 ** 2:>12.1f}"
+                     f"{stage['bytes_written'] / 1024 ** 2:>14.1f}{stage['files']:>8}")
+    return '\n'.join(lines)
 
-    Exits with status code 1 if an error occurs during argument validation or any subsequent operations.
+
+def file_signature(path):
+    """Returns the modification time and size of a file, or None when it does not exist."""
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def watch(signatures, rebuild, interval=WATCH_INTERVAL):
+    """
+    Polls for changes and rebuilds what changed, until interrupted with Ctrl+C.
+
+    Args:
+    signatures (callable): Returns a dict with the current signature of everything watched (see file_signature), or
+    None when it can not be read right now.
+    rebuild (callable): Called with the list of keys whose signature changed since the last rebuild.
+    interval (float): Time between polls, in seconds.
+
+    A change is only rebuilt once its signatures stay the same for one more interval, so a package still being
+    downloaded is not built half-written. When the signatures can not be read at the start, everything is rebuilt once
+    they can.
+    """
+    built = signatures() or {}
+    print(f"Watching for changes every {interval} s, press Ctrl+C to stop...\n")
+    try:
+        while True:
+            time.sleep(interval)
+            current = signatures()
+            if current is None or current == built:
+                continue
+            time.sleep(interval)
+            if signatures() != current:
+                continue  # still being written
+            changed = [key for key, signature in current.items() if signature != built.get(key)]
+            built = current
+            if changed:
+                rebuild(changed)
+                print(f"Watching for changes every {interval} s, press Ctrl+C to stop...\n")
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+
+def check_problem(source_zip):
+    """
+    Validates a Polygon package without building it, reading only its central directory and problem.xml.
+
+    Args:
+    source_zip (str or file): The path of the Polygon package, or a seekable binary file object holding it.
+
+    Returns:
+    tuple: The list of errors, which make the build fail, and the list of warnings found in the package.
+    """
+    errors = []
+    warnings = []
+    try:
+        with zipfile.ZipFile(source_zip, 'r') as polygon_zip:
+            names = set(polygon_zip.namelist())
+            errors += [f"Required file '/{file}' not found in the ZIP package." for file in REQUIRED_FILES
+                       if file not in names]
+            if 'problem.xml' not in names:
+                return errors, warnings
+            xml_root = parse_problem_xml(polygon_zip)
+    except (OSError, zipfile.BadZipFile, PackageError) as e:
+        return errors + [f"Can not read the package: {e}"], warnings
+
+    judging = xml_root.find('judging')
+    testsets = [] if judging is None else judging.findall('testset')
+    if not testsets:
+        errors.append("No testset found in problem.xml.")
+    for testset in testsets:
+        name = testset.attrib.get('name')
+        try:
+            tests = index_tests(testset, names)
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append(f"Can not list the tests of testset {name}: {e}")
+            continue
+        if not tests:
+            warnings.append(f"Testset {name} has no tests.")
+        missing = [file for test in tests for file in test if file not in names]
+        if missing:
+            errors.append(f"Test files missing from testset {name}: {', '.join(missing[:10])}"
+                          + (f" and {len(missing) - 10} more." if len(missing) > 10 else "."))
+        prefix = name + '/'
+        orphans = sorted(file for file in names if file.startswith(prefix) and '/' not in file[len(prefix):]
+                         and file.endswith('.a') and file[:-2] not in names)
+        if orphans:
+            errors.append(f"Answer files without an input in testset {name}: {', '.join(orphans[:10])}"
+                          + (f" and {len(orphans) - 10} more." if len(orphans) > 10 else "."))
+
+    try:
+        clang_timelimit, _, _ = get_limits(xml_root)
+        if clang_timelimit > MAX_CLANG_TIMELIMIT:
+            warnings.append(f"Time limit for C/C++ is {clang_timelimit} s, greater than {MAX_CLANG_TIMELIMIT} s.")
+    except PackageError as e:
+        errors.append(str(e))
+    try:
+        get_problem_name(xml_root)
+    except PackageError as e:
+        errors.append(str(e))
+    return errors, warnings
+
+
+def package_fingerprint(polygon_zip):
+    """
+    Identifies the contents of a zip file from its central directory alone: a SHA-256 digest of the name, CRC-32 and
+    size of every member, which changes whenever any member changes, without reading any member.
+    """
+    digest = hashlib.sha256()
+    for member_info in sorted(polygon_zip.infolist(), key=lambda info: info.filename):
+        digest.update(f"{member_info.filename}\0{member_info.CRC:08x}\0{member_info.file_size}\0".encode())
+    return digest.hexdigest()
+
+
+def problem_metadata(source_zip, cache_folder=None):
+    """
+    Reads the name, limits and tests of a Polygon package, for tools that list many packages without building them.
+
+    Only the central directory and the start of problem.xml are read (see parse_problem_xml). When cache_folder is
+    given, the metadata is kept in its metadata folder, keyed by package_fingerprint, so listing the same package
+    again reads nothing but its central directory.
+
+    Args:
+    source_zip (str or file): The path of the Polygon package, or a seekable binary file object holding it.
+    cache_folder (str): The cache folder, or None to not cache the metadata.
+
+    Returns:
+    dict: The names of the problem by language, the name BOCA shows (see get_problem_name), the Polygon time limit in
+    milliseconds, the C/C++ time limit in seconds and its repetitions (see get_limits), the memory limit in MB, the
+    number of tests of each testset and whether the Portuguese statement PDF is there.
+    """
+    try:
+        with zipfile.ZipFile(source_zip, 'r') as polygon_zip:
+            cache_file = None
+            if cache_folder is not None:
+                cache_file = os.path.join(cache_folder, 'metadata', package_fingerprint(polygon_zip) + '.json')
+                try:
+                    with open(cache_file) as metadata_file:
+                        metadata = json.load(metadata_file)
+                    os.utime(cache_file)  # marks the entry as recently used (see evict_cache)
+                    return metadata
+                except (OSError, ValueError):
+                    pass
+
+            if 'problem.xml' not in polygon_zip.NameToInfo:
+                raise FileNotFoundError("problem.xml not found in the ZIP package.")
+            xml_root = parse_problem_xml(polygon_zip)
+            clang_timelimit, repetitions, memory_limit = get_limits(xml_root)
+            names = set(polygon_zip.NameToInfo)
+            metadata = {
+                'names': {name_element.get('language'): name_element.get('value').replace(r'\&', '&')
+                          for name_element in xml_root.iterfind('names/name')},
+                'name': get_problem_name(xml_root),
+                'time_limit_ms': int(xml_root.find('judging').find('testset').findtext('time-limit')),
+                'timelimit': clang_timelimit,
+                'repetitions': repetitions,
+                'memory_limit': memory_limit,
+                'testsets': {testset.get('name'): len(index_tests(testset, names))
+                             for testset in xml_root.find('judging').findall('testset')},
+                'statement_pdf': 'statements/.pdf/portuguese/problem.pdf' in names
+            }
+
+        if cache_file is not None:
+            ensure_dir_exists(os.path.dirname(cache_file))
+            staging_fd, staging_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(cache_file))
+            with os.fdopen(staging_fd, 'w') as metadata_file:
+                json.dump(metadata, metadata_file)
+            os.replace(staging_file, cache_file)
+        return metadata
+    except PackageError:
+        raise
+    except Exception as e:
+        raise PackageError(str(e)) from e
+
+
+def collect_members(polygon_zip, problem_idx, java_tl_factor, python_tl_factor, compile_checker_binary, fast_compare,
+                    binaries_folder, metrics=None, log=print):
+    """
+    Reads problem.xml and assembles the members of the BOCA package of a problem (see write_package).
+
+    Args:
+    polygon_zip (ZipFile): The opened polygon package.
+    binaries_folder (str): The folder compiled checker and comparator binaries are kept in (see compile_cached).
+    metrics (dict): When given, receives the counters of each stage (see measure_stage).
+    log (callable): Receives the progress messages.
+
+    The other arguments are the ones of make_problem.
+
+    Returns:
+    dict: The package members.
     """
+    with measure_stage(metrics, 'read_package'):
+        xml_root = parse_problem_xml(polygon_zip)
+
+    members = {}
+    with measure_stage(metrics, 'template', members):
+        make_template(members)
+
+    log("Creating input and output files...\n")
+    with measure_stage(metrics, 'inputs_outputs', members):
+        make_inputs_outputs(xml_root, members, polygon_zip)
+
+    log("Getting time and memory limits from problem.xml...\n")
+    with measure_stage(metrics, 'limits', members):
+        clang_timelimit, repetitions, memory_limit = get_limits(xml_root)
+        if clang_timelimit > MAX_CLANG_TIMELIMIT:
+            log(f"[WARNING] Problem with time limit greater than {MAX_CLANG_TIMELIMIT} seconds for C/C++!")
+        java_limits = scale_timelimit(clang_timelimit, repetitions, java_tl_factor)
+        python_limits = scale_timelimit(clang_timelimit, repetitions, python_tl_factor)
+        time_limits = {
+            'c': (clang_timelimit, repetitions),
+            'cpp': (clang_timelimit, repetitions),
+            'java': java_limits,
+            'kt': java_limits,
+            'py3': python_limits
+        }
+
+        log("Creating limits files...\n")
+        make_limits(members, time_limits, memory_limit)
+
+    log("Copying checker sources...\n")
+    with measure_stage(metrics, 'checker', members):
+        members['compare/check.cpp'] = ('polygon', 'check.cpp')
+        members['compare/testlib.h'] = ('polygon', 'files/testlib.h')
+        if compile_checker_binary:
+            log("Compiling checker...\n")
+            members['compare/check'] = ('file', compile_checker(polygon_zip, binaries_folder))
+        if fast_compare:
+            log("Compiling fast comparator...\n")
+            members['compare/fastcmp'] = ('file', compile_fast_comparator(binaries_folder))
+
+    log("Creating description files...\n")
+    with measure_stage(metrics, 'description', members):
+        make_description(polygon_zip, xml_root, members, problem_idx)
+    return members
+
+
+def build_problem(source_zip, letter, factors=(1, 1), out=None, raw_copy=True, compile_checker_binary=False,
+                  fast_compare=False, compression_level=None, threads=None, memory_budget=None, cache_folder=None,
+                  metrics=None):
+    """
+    Builds the BOCA package of a problem from a Polygon Full package and writes it to out.
+
+    This is the entry point for programs that embed the builder, such as a server building packages on request. It
+    does not depend on the current directory, writes nothing but out (and compiled binaries to cache_folder), prints
+    nothing and raises PackageError on errors.
 
-    check_run_directory()
+    Args:
+    source_zip (str or file): The path of the Polygon package, or a seekable binary file object holding it.
+    letter (str): The problem letter.
+    factors (tuple): The Java and Python time limit factors, relative to C/C++.
+    out (str or file): The path of the zip file to write, or a seekable binary file object such as io.BytesIO. When
+    None, the package is returned as bytes.
+    cache_folder (str): The folder compiled checker and comparator binaries are kept in and reused from. When None,
+    they are compiled for this build only.
+
+    The other arguments are the ones of make_problem.
+
+    Returns:
+    bytes: The package, when out is None.
+    """
+    java_tl_factor, python_tl_factor = factors
+    output = io.BytesIO() if out is None else out
+    with measure_stage(metrics, 'read_package'):
+        polygon_zip = open_polygon_package(source_zip)
+    try:
+        with tempfile.TemporaryDirectory(prefix='boca_binaries_') as temp_folder:
+            binaries_folder = temp_folder if cache_folder is None else os.path.join(cache_folder, 'binaries')
+            members = collect_members(polygon_zip, letter, java_tl_factor, python_tl_factor, compile_checker_binary,
+                                      fast_compare, binaries_folder, metrics, lambda message: None)
+            if compression_level is None:
+                compression_level = zlib.Z_DEFAULT_COMPRESSION
+            else:
+                raw_copy = False
+            with measure_stage(metrics, 'write_zip') as stage:
+                write_package(output, polygon_zip, members, raw_copy, metrics, compression_level, threads,
+                              memory_budget)
+                stage['files'] = len(PACKAGE_FOLDERS) + len(members)
+    except Exception:
+        if isinstance(out, str) and os.path.exists(out):
+            os.remove(out)
+        raise
+    finally:
+        polygon_zip.close()
+    if out is None:
+        return output.getvalue()
+
+
+def make_problem(problem_idx, file_name, java_tl_factor=1, python_tl_factor=1, no_backup=False, zip_only=False,
+                 raw_copy=True, cache=False, cache_max_size=CACHE_MAX_SIZE_MB, cache_max_age=CACHE_MAX_AGE_DAYS,
+                 keep_backups=None, compile_checker_binary=False, fast_compare=False, compression_level=None,
+                 threads=None, incremental=False, disk_budget=None, memory_budget=None, blob_store_folder=None,
+                 folder=SCRIPT_FOLDER, metrics=None):
+    """
+    Builds the BOCA package of a single problem from a Polygon Full package.
 
-    problem_idx, file_name, java_tl_factor, python_tl_factor, no_backup, zip_only = validate_arguments(sys.argv)
+    The package is written to zip_packages/Problem_<problem_idx>.zip, with its manifest (see package_manifest) in
+    zip_packages/Problem_<problem_idx>.manifest.json, and, unless zip_only is set, unpacked into
+    packages/Problem_<problem_idx>, backing up any previous version first. These folders, and the backups and cache
+    folders, are inside folder.
 
-    packages_folder = 'packages/Problem_' + problem_idx
+    Args:
+    problem_idx (str): The problem letter.
+    file_name (str): The path to the Polygon package zip file.
+    java_tl_factor (int or float): Multiplier for the Java time limit relative to C/C++, possibly fractional (see
+    scale_timelimit).
+    python_tl_factor (int or float): Multiplier for the Python time limit relative to C/C++.
+    no_backup (bool): Skip the backup of a previous package.
+    zip_only (bool): Only write the zip file, leaving the packages folder untouched.
+    raw_copy (bool): Copy tests and other members compressed from the Polygon package instead of recompressing them.
+    cache (bool): Reuse the package of a previous build with the same inputs (see build_cache_key) from the cache
+    folder, and leave packages/Problem_<problem_idx> untouched when it already holds that build. The compiled checker
+    and comparator binaries are kept there too; without the cache, they are compiled for this build only.
+    cache_max_size (int): Size limit of the cache folder, in megabytes.
+    cache_max_age (int): Cached packages not used for this many days are removed.
+    keep_backups (int): When given, only the newest keep_backups backups of the problem are kept.
+    compile_checker_binary (bool): Compile check.cpp now and ship the binary as compare/check, so the judge does not
+    compile it on the first run of the problem.
+    fast_compare (bool): Compile tools/fastcmp.c and ship it as compare/fastcmp, which the compare scripts use
+    instead of their chain of diff calls when there is no checker.
+    compression_level (int or str): The zlib level (0 to 9) the package is compressed with, or 'store' to not
+    compress it. Giving a level implies raw_copy=False, so the tests are compressed again at that level.
+    threads (int): Number of threads compressing the package, the number of CPUs by default.
+    incremental (bool): Update packages/Problem_<problem_idx> in place, writing only the files that changed since
+    the previous build, instead of unpacking the whole package again.
+    disk_budget (int): When given, the build fails before writing anything if it would write more than this many
+    megabytes to zip_packages, packages and the backup of the previous package (see estimate_backup_size). The build
+    always fails early when the disk does not have room for it.
+    memory_budget (int): When given, bounds the memory used to compress the package to about this many megabytes.
+    blob_store_folder (str): When given, the files unpacked to packages/ and backed up to backups/ are hard links to
+    the blobs of this content-addressed store (see blob_store.py), so identical tests reused across problems,
+    versions and contests are written and stored only once.
+    folder (str): The folder the package is built in, the folder of this script by default.
+    metrics (dict): When given, receives the counters of each build stage (see measure_stage).
+
+    Only the members the BOCA package needs are read from the Polygon package, and they are written straight into
+    the output zip file, so nothing is extracted to /tmp. This function runs in-process, so make_contest.py can build
+    several problems at the same time. Errors raise PackageError.
+    """
+    packages_base = os.path.join(folder, 'packages')
+    zip_packages_folder = os.path.join(folder, 'zip_packages')
+    backups_folder = os.path.join(folder, 'backups')
+    cache_folder = os.path.join(folder, CACHE_FOLDER)
+    packages_folder = os.path.join(packages_base, 'Problem_' + problem_idx)
+    key_file = os.path.join(packages_base, '.Problem_' + problem_idx + '.key')
+    index_file = os.path.join(packages_base, '.Problem_' + problem_idx + '.index')
 
     if not zip_only:
-        ensure_dir_exists('packages')
+        ensure_dir_exists(packages_base)
     if not no_backup and not zip_only:
-        ensure_dir_exists('backups')
-    ensure_dir_exists('zip_packages')
-    output_zip = 'zip_packages/Problem_' + problem_idx + '.zip'
-    temp_root, problem_folder, polygon_folder = create_workspace(problem_idx)
-    atexit.register(rmtree, temp_root, ignore_errors=True)
-    if os.path.exists(output_zip):
-        os.remove(output_zip)
-
-    for folder in os.listdir('problem_template'):
-        copytree('problem_template/' + folder, problem_folder + '/' + folder)
-    ensure_dir_exists(problem_folder + '/input')
-    ensure_dir_exists(problem_folder + '/output')
-    ensure_dir_exists(problem_folder + '/description')
-    ensure_dir_exists(problem_folder + '/limits')
-    ensure_dir_exists(problem_folder + '/compare')
-    ensure_dir_exists(problem_folder + '/run')
+        ensure_dir_exists(backups_folder)
+    ensure_dir_exists(zip_packages_folder)
+    output_zip = os.path.join(zip_packages_folder, 'Problem_' + problem_idx + '.zip')
+    manifest_file = os.path.join(zip_packages_folder, 'Problem_' + problem_idx + '.manifest.json')
+    for previous_file in (output_zip, manifest_file):
+        if os.path.exists(previous_file):
+            os.remove(previous_file)
 
     print("\n========================================\n")
     print("Making problem " + problem_idx + " from " + file_name)
     print("[*] Java timelimit factor is " + str(java_tl_factor))
     print("[*] Python timelimit factor is " + str(python_tl_factor) + "\n")
 
-    print("Unzipping package...\n")
-    unzip_and_check_polygon_package(file_name, polygon_folder)
-
-    xml_tree = eT.parse(polygon_folder + '/problem.xml')
-    xml_root = xml_tree.getroot()
+    cache_key = None
+    if cache:
+        with measure_stage(metrics, 'cache_key'):
+            ensure_dir_exists(cache_folder)
+            settings = [java_tl_factor, python_tl_factor, raw_copy, compile_checker_binary, fast_compare,
+                        compression_level]
+            cache_key = build_cache_key(file_name, problem_idx, settings)
+            cached_zip = os.path.join(cache_folder, cache_key + '.zip')
+
+    reused = False
+    if cache_key and os.path.exists(cached_zip):
+        with measure_stage(metrics, 'cache') as stage:
+            try:
+                os.utime(cached_zip)  # marks the entry as recently used
+                link_or_copy(cached_zip, output_zip)
+                reused = True
+                stage['files'] = 1
+            except FileNotFoundError:
+                pass  # evicted by a build running at the same time, so the package is built again
+    if reused:
+        print("Reusing cached package " + cache_key[:12] + "...\n")
+    else:
+        print("Reading package...\n")
+        with measure_stage(metrics, 'read_package'):
+            polygon_zip = open_polygon_package(file_name)
+        staging_fd, staging_zip = tempfile.mkstemp(prefix='.Problem_' + problem_idx + '_', suffix='.zip',
+                                                   dir=zip_packages_folder)
+        os.close(staging_fd)
+        os.chmod(staging_zip, 0o644)  # mkstemp creates it readable by its owner only
+        # Without the cache, the binaries are compiled for this build only, so they do not pile up in the cache folder
+        binaries_folder = os.path.join(cache_folder, 'binaries') if cache else tempfile.mkdtemp(prefix='boca_binaries_')
+        try:
+            members = collect_members(polygon_zip, problem_idx, java_tl_factor, python_tl_factor,
+                                      compile_checker_binary, fast_compare, binaries_folder, metrics)
+
+            raw_copy = raw_copy and compression_level is None
+            if compression_level is None:
+                compression_level = zlib.Z_DEFAULT_COMPRESSION
+
+            with measure_stage(metrics, 'space_check'):
+                zip_size, package_size = estimate_package_size(polygon_zip, members, raw_copy)
+                needed = {zip_packages_folder: zip_size}
+                if not zip_only:
+                    needed[packages_base] = package_size
+                    if not no_backup and os.path.exists(packages_folder):
+                        if blob_store_folder is not None:
+                            ensure_dir_exists(blob_store_folder)
+                        backup_needs = estimate_backup_size(packages_folder, backups_folder, problem_idx,
+                                                            blob_store_folder, index_file)
+                        for backup_folder, size in backup_needs.items():
+                            needed[backup_folder] = needed.get(backup_folder, 0) + size
+                check_disk_space(needed, disk_budget)
+
+            print("Zipping package...\n")
+            with measure_stage(metrics, 'write_zip') as stage:
+                write_package(staging_zip, polygon_zip, members, raw_copy, metrics, compression_level, threads,
+                              memory_budget)
+                stage['files'] = len(PACKAGE_FOLDERS) + len(members)
+                os.replace(staging_zip, output_zip)
+        finally:
+            polygon_zip.close()
+            if os.path.exists(staging_zip):
+                os.remove(staging_zip)
+            if not cache:
+                rmtree(binaries_folder, ignore_errors=True)
+
+        if cache_key:
+            print("Storing package in the cache...\n")
+            with measure_stage(metrics, 'cache') as stage:
+                link_or_copy(output_zip, cached_zip)
+                stage['files'] = 1
+
+    if cache_key:
+        with measure_stage(metrics, 'cache'):
+            evict_cache(cache_folder, cache_max_size, cache_max_age)
+
+    with measure_stage(metrics, 'manifest') as stage:
+        write_manifest(output_zip, manifest_file)
+        stage['files'] = 1
 
-    print("Creating input and output files...\n")
-    make_inputs_outputs(xml_root, problem_folder, polygon_folder)
-
-    print("Getting time and memory limits from problem.xml...\n")
-    clang_timelimit, repetitions, memory_limit = get_limits(xml_root)
-    java_timelimit = clang_timelimit * java_tl_factor
-    python_timelimit = clang_timelimit * python_tl_factor
+    if not zip_only:
+        previous_key = None
+        if os.path.exists(key_file):
+            with open(key_file) as key:
+                previous_key = key.read().strip()
+            os.remove(key_file)
+
+        if cache_key and previous_key == cache_key and os.path.exists(packages_folder):
+            print("Package folder is up to date.\n")
+        else:
+            previous_index = None
+            if os.path.exists(index_file):
+                if incremental and os.path.exists(packages_folder):
+                    with open(index_file) as index:
+                        previous_index = json.load(index)
+
+            if os.path.exists(packages_folder):
+                if not no_backup:
+                    print("Backing up previous package...\n")
+                    with measure_stage(metrics, 'backup') as stage:
+                        stage['files'] = backup(packages_folder, backups_folder, problem_idx, keep_backups,
+                                                blob_store_folder, index_file)
+                if previous_index is None:
+                    with measure_stage(metrics, 'remove_previous'):
+                        rmtree(packages_folder)
+
+            if os.path.exists(index_file):
+                os.remove(index_file)
+
+            if previous_index is None:
+                print("Unpacking package to packages folder...\n")
+                with measure_stage(metrics, 'extract') as stage:
+                    stage['files'], package_files = extract_package(output_zip, packages_folder,
+                                                                    store=blob_store_folder)
+            else:
+                print("Updating changed files in packages folder...\n")
+                with measure_stage(metrics, 'sync') as stage:
+                    stage['files'], package_files = extract_package(output_zip, packages_folder, previous_index,
+                                                                    blob_store_folder)
+                print(f"[*] {stage['files']} file(s) updated\n")
+            with open(index_file, 'w') as index:
+                json.dump(package_files, index)
+
+        if cache_key:
+            with open(key_file, 'w') as key:
+                print(cache_key, file=key)
 
-    print("Creating limits files...\n")
-    limits_folder = problem_folder + '/limits'
-    make_limits(limits_folder, repetitions, memory_limit, clang_timelimit, java_timelimit, python_timelimit)
+    print("Done!\n")
+    print("========================================\n")
 
-    print("Copying checker sources...\n")
-    compare_folder = problem_folder + '/compare'
-    copy(polygon_folder + '/check.cpp', compare_folder + '/check.cpp')
-    copy(polygon_folder + '/files/testlib.h', compare_folder + '/testlib.h')
 
-    print("Creating description files...\n")
-    make_description(polygon_folder, xml_root, problem_folder, problem_idx)
+if __name__ == '__main__':
+    """
+    Main entry point of the script. Parses command line arguments, performs initial setup,
+    and orchestrates the execution of the main functionalities of the script.
 
-    if not zip_only and os.path.exists(packages_folder):
-        if not no_backup:
-            print("Backing up previous package...\n")
-            backup(packages_folder, 'backups', problem_idx)
-        rmtree(packages_folder)
+    The script processes a polygon package based on the provided problem identifier and zip file,
+    applying configurations and preparing it for a competitive programming environment.
 
-    print("Zipping package...\n")
-    staging_archive = temp_root + '/Problem_' + problem_idx
-    make_archive(staging_archive, 'zip', problem_folder)
-    os.replace(staging_archive + '.zip', output_zip)
+    Command Line Arguments:
+    1. Problem Identifier (str): A single uppercase letter representing the problem.
+    2. Polygon Package (str): Path to the zip file containing the problem package.
+    3. Java Time Limit Factor (int, optional): Multiplier for the Java time limit relative to C/C++.
+    4. Python Time Limit Factor (int, optional): Multiplier for the Python time limit relative to C/C++.
 
-    if not zip_only:
-        print("Moving package to packages folder...\n")
-        copytree(problem_folder, packages_folder)
+    The package is built in the folder of this script, whatever the current directory.
 
-    print("Done!\n")
-    print("========================================\n")
+    Exits with status code 1 if an error occurs during argument validation or any subsequent operations.
+    """
+    problem_idx, file_name, java_tl_factor, python_tl_factor, options = validate_arguments(sys.argv)
+    profile = options.pop('profile')
+    metrics_json = options.pop('metrics_json', None)
+    watch_package = options.pop('watch')
+
+    def build():
+        metrics = {} if profile or metrics_json else None
+        with measure_stage(metrics, 'total'):
+            make_problem(problem_idx, file_name, java_tl_factor, python_tl_factor, **options, metrics=metrics)
+
+        if profile:
+            print(format_metrics(metrics))
+        if metrics_json:
+            with open(metrics_json, 'w') as metrics_file:
+                json.dump({'problem': problem_idx, 'package': file_name, 'stages': metrics}, metrics_file, indent=2)
+
+    if not watch_package:
+        try:
+            build()
+        except PackageError as e:
+            print("Error:", e)
+            sys.exit(1)
+    else:
+        # Keep watching after a failed build, the next download may fix it
+        def rebuild(_=None):
+            try:
+                build()
+            except PackageError as e:
+                print("Error:", e)
+                print(f"Building problem {problem_idx} failed, waiting for a new package...\n")
+
+        options['incremental'] = True
+        rebuild()
+        watch(lambda: {file_name: file_signature(file_name)}, rebuild)
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import os
+import shutil
+import ssl
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+import make_from_full_package
+from make_from_full_package import PackageError
+
+# Folder the built packages and their manifests are published from
+ZIP_FOLDER = os.path.join(make_from_full_package.SCRIPT_FOLDER, 'zip_packages')
+
+# Size of the chunks packages are read, sent and received in
+BUFFER_SIZE = 1024 * 1024
+
+# Packages sent to the same target at the same time, which is also the number of connections kept open to it
+DEFAULT_CONNECTIONS = 2
+
+# Seconds an HTTP connection may go without sending or receiving anything before the target is considered
+# unreachable. It limits each step of a request, not the whole request, so large packages take as long as they need.
+HTTP_TIMEOUT = 120
+
+DEFAULT_PORT = 8000
+
+
+def list_packages(folder=ZIP_FOLDER, letters=None):
+    """
+    Lists the packages of a zip_packages folder, writing the manifest of those built before manifests existed.
+
+    Args:
+    folder (str): The folder with the Problem_<letter>.zip files.
+    letters (iterable of str): Only the packages of these problems are listed, when given.
+
+    Returns:
+    list of tuple: The name (such as Problem_A), zip file path, manifest path and SHA-256 digest of each package.
+    """
+    packages = []
+    if not os.path.isdir(folder):
+        return packages
+    wanted = set(letters) if letters else None
+    for file in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(file)
+        if extension != '.zip' or not name.startswith('Problem_'):
+            continue
+        if wanted is not None and name[len('Problem_'):] not in wanted:
+            continue
+        zip_path = os.path.join(folder, file)
+        manifest_path = os.path.join(folder, name + '.manifest.json')
+        if not os.path.exists(manifest_path):
+            make_from_full_package.write_manifest(zip_path, manifest_path)
+        with open(manifest_path) as manifest_file:
+            packages.append((name, zip_path, manifest_path, json.load(manifest_file)['sha256']))
+    return packages
+
+
+def manifest_digest(data):
+    """Returns the SHA-256 digest recorded in the bytes of a manifest, or None when they are not a manifest."""
+    try:
+        return json.loads(data)['sha256']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+async def idle_timeout(awaitable):
+    """Awaits one step of an HTTP exchange, raising asyncio.TimeoutError when it takes over HTTP_TIMEOUT seconds."""
+    return await asyncio.wait_for(awaitable, HTTP_TIMEOUT)
+
+
+class DirectoryTarget:
+    """A folder packages are copied to, such as a folder shared with a judge machine."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.connections_opened = None
+
+    def __str__(self):
+        return self.folder
+
+    async def remote_digest(self, name):
+        """Returns the SHA-256 digest of the manifest of the package already in the folder, if any."""
+        manifest_path = os.path.join(self.folder, name + '.manifest.json')
+        try:
+            with open(manifest_path, 'rb') as manifest_file:
+                return manifest_digest(manifest_file.read())
+        except FileNotFoundError:
+            return None
+
+    async def upload(self, name, zip_path, manifest_path):
+        """Copies a package and then its manifest, each through a temporary file, so readers never see half of it."""
+        for source, target in ((zip_path, name + '.zip'), (manifest_path, name + '.manifest.json')):
+            await asyncio.to_thread(self._copy, source, os.path.join(self.folder, target))
+
+    @staticmethod
+    def _copy(source, target):
+        descriptor, staging = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.' + os.path.basename(target))
+        try:
+            with open(source, 'rb') as source_file, os.fdopen(descriptor, 'wb') as staging_file:
+                shutil.copyfileobj(source_file, staging_file, BUFFER_SIZE)
+            os.chmod(staging, 0o644)
+            os.replace(staging, target)
+        except BaseException:
+            os.remove(staging)
+            raise
+
+    async def close(self):
+        pass
+
+
+class HttpTarget:
+    """
+    An HTTP endpoint packages are sent to with PUT requests, such as the stand-in server of publish.py --serve.
+
+    The package of a problem is stored at the endpoint URL followed by Problem_<letter>.zip, and its manifest next
+    to it. Requests go over a pool of keep-alive HTTP/1.1 connections, so each connection is opened once per publish
+    instead of once per request.
+    """
+
+    def __init__(self, url, connections=DEFAULT_CONNECTIONS):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise PackageError(f"Invalid target URL {url}.")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.base_path = parts.path.rstrip('/') + '/'
+        self.host_header = parts.netloc.rsplit('@', 1)[-1]
+        self.connections_opened = 0
+        self.pool = asyncio.LifoQueue()
+        for _ in range(connections):
+            self.pool.put_nowait(None)  # opened when first used
+
+    def __str__(self):
+        return self.url
+
+    async def remote_digest(self, name):
+        """Returns the SHA-256 digest of the manifest of the package already at the endpoint, if any."""
+        status, body = await self.request('GET', name + '.manifest.json')
+        if status == 404:
+            return None
+        if status != 200:
+            raise PackageError(f"GET {name}.manifest.json returned HTTP {status}.")
+        return manifest_digest(body)
+
+    async def upload(self, name, zip_path, manifest_path):
+        """Sends a package and then its manifest, so the manifest only changes once the package is in place."""
+        for path, target in ((zip_path, name + '.zip'), (manifest_path, name + '.manifest.json')):
+            status, _ = await self.request('PUT', target, path)
+            if not 200 <= status < 300:
+                raise PackageError(f"PUT {target} returned HTTP {status}.")
+
+    async def request(self, method, name, body_path=None):
+        """
+        Sends a request over a pooled connection, opening a new one when needed.
+
+        A request that fails on a reused connection is sent again over a new one once, since the server may have
+        closed the connection while it was idle.
+
+        Returns:
+        tuple: The status code and the body of the response.
+        """
+        connection = await self.pool.get()
+        try:
+            while True:
+                reused = connection is not None
+                if not reused:
+                    connection = await idle_timeout(asyncio.open_connection(self.host, self.port, ssl=self.ssl))
+                    self.connections_opened += 1
+                try:
+                    status, keep_alive, body = await self._exchange(connection, method, self.base_path + quote(name),
+                                                                    body_path)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    await self._close_connection(connection)
+                    connection = None
+                    if reused:
+                        continue
+                    raise PackageError(f"{method} {name} failed: {str(e) or type(e).__name__}") from e
+                except BaseException:
+                    await self._close_connection(connection)
+                    connection = None
+                    raise
+                if not keep_alive:
+                    await self._close_connection(connection)
+                    connection = None
+                return status, body
+        except (OSError, asyncio.TimeoutError) as e:
+            raise PackageError(f"{method} {name} failed: {str(e) or type(e).__name__}") from e
+        finally:
+            self.pool.put_nowait(connection)
+
+    async def _exchange(self, connection, method, path, body_path):
+        """
+        Writes one request, streaming the file at body_path as its body, and reads the whole response. Every write
+        and read is limited by HTTP_TIMEOUT on its own, so only a stalled connection times out.
+        """
+        reader, writer = connection
+        size = os.path.getsize(body_path) if body_path else 0
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host_header}\r\nContent-Length: {size}\r\n"
+                     f"Content-Type: application/octet-stream\r\n\r\n".encode('latin-1'))
+        if body_path:
+            with open(body_path, 'rb') as body_file:
+                for chunk in iter(lambda: body_file.read(BUFFER_SIZE), b''):
+                    writer.write(chunk)
+                    await idle_timeout(writer.drain())
+        await idle_timeout(writer.drain())
+
+        status_line = await idle_timeout(reader.readline())
+        if not status_line:
+            raise ConnectionResetError("connection closed by the server")
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await idle_timeout(reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        connection_header = headers.get('connection', '').lower()
+        keep_alive = connection_header == 'keep-alive' or (version == 'HTTP/1.1' and connection_header != 'close')
+        if status.startswith('1') or status in ('204', '304'):
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                chunk_size = int((await idle_timeout(reader.readline())).split(b';')[0], 16)
+                if chunk_size == 0:
+                    while (await idle_timeout(reader.readline())) not in (b'\r\n', b'\n', b''):
+                        pass  # trailer
+                    break
+                chunks.append(await idle_timeout(reader.readexactly(chunk_size)))
+                await idle_timeout(reader.readexactly(2))
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await idle_timeout(reader.readexactly(int(headers['content-length'])))
+        else:
+            body = await idle_timeout(reader.read())
+            keep_alive = False
+        return int(status), keep_alive, body
+
+    @staticmethod
+    async def _close_connection(connection):
+        _, writer = connection
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+    async def close(self):
+        """Closes the pooled connections."""
+        while not self.pool.empty():
+            connection = self.pool.get_nowait()
+            if connection is not None:
+                await self._close_connection(connection)
+
+
+def make_target(destination, connections=DEFAULT_CONNECTIONS):
+    """Returns the target for an http(s):// URL or a folder, creating the folder when it does not exist."""
+    if destination.startswith(('http://', 'https://')):
+        return HttpTarget(destination, connections)
+    make_from_full_package.ensure_dir_exists(destination)
+    return DirectoryTarget(os.path.abspath(destination))
+
+
+async def publish_to_target(target, packages, connections, force):
+    """
+    Sends the packages whose manifest differs from the one on the target, up to connections at the same time.
+
+    Returns:
+    dict: What was sent, skipped and failed, the bytes sent, the seconds taken and the connections opened.
+    """
+    report = {'target': str(target), 'sent': [], 'skipped': [], 'failed': {}, 'bytes': 0}
+    limit = asyncio.Semaphore(connections)
+
+    async def publish_package(name, zip_path, manifest_path, digest):
+        async with limit:
+            try:
+                if not force and await target.remote_digest(name) == digest:
+                    report['skipped'].append(name)
+                    return
+                await target.upload(name, zip_path, manifest_path)
+            except (PackageError, OSError) as e:
+                report['failed'][name] = str(e)
+                return
+            report['sent'].append(name)
+            report['bytes'] += os.path.getsize(zip_path) + os.path.getsize(manifest_path)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(publish_package(*package) for package in packages))
+    finally:
+        await target.close()
+    report['seconds'] = time.perf_counter() - start
+    report['connections'] = target.connections_opened
+    for key in ('sent', 'skipped'):
+        report[key].sort()
+    return report
+
+
+async def publish_async(packages, destinations, connections=DEFAULT_CONNECTIONS, force=False):
+    """Publishes the packages to every destination at the same time. Returns the report of each destination."""
+    targets = [make_target(destination, connections) for destination in destinations]
+    return await asyncio.gather(*(publish_to_target(target, packages, connections, force) for target in targets))
+
+
+def publish_packages(destinations, letters=None, connections=DEFAULT_CONNECTIONS, force=False, folder=ZIP_FOLDER):
+    """
+    Sends the built packages, with their manifests, to judges or shared folders.
+
+    A package is only sent to a destination whose copy of its manifest has a different SHA-256 digest, or none, so
+    publishing again after rebuilding a contest only sends the problems that changed. Every destination is published
+    to at the same time, each over its own connections.
+
+    Args:
+    destinations (list of str): Folders and http(s):// URLs of endpoints that accept PUT requests.
+    letters (iterable of str): Only the packages of these problems are published, when given.
+    connections (int): The number of packages sent to each destination at the same time.
+    force (bool): Sends every package, even those the destination already has.
+    folder (str): The folder the packages were built to.
+
+    Returns:
+    list of dict: The report of each destination (see publish_to_target).
+    """
+    if connections < 1:
+        raise PackageError("The number of connections must be positive.")
+    packages = list_packages(folder, letters)
+    return asyncio.run(publish_async(packages, destinations, connections, force))
+
+
+def print_report(reports):
+    """Prints the packages sent, skipped and failed and the throughput of each destination, and each failure."""
+    width = max([len('target')] + [len(report['target']) for report in reports])
+    print(f"{'target':<{width}}  {'sent':>4}  {'skipped':>7}  {'failed':>6}  {'MB':>8}  {'s':>7}  {'MB/s':>8}  "
+          f"connections")
+    for report in reports:
+        megabytes = report['bytes'] / 1024 ** 2
+        throughput = megabytes / report['seconds'] if report['seconds'] > 0 else 0
+        print(f"{report['target']:<{width}}  {len(report['sent']):>4}  {len(report['skipped']):>7}  "
+              f"{len(report['failed']):>6}  {megabytes:>8.2f}  {report['seconds']:>7.3f}  {throughput:>8.2f}  "
+              f"{'-' if report['connections'] is None else report['connections']}")
+    for report in reports:
+        for name, error in sorted(report['failed'].items()):
+            print(f"  {name} to {report['target']}: {error}")
+
+
+class PackageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files of a folder with GET and stores files sent with PUT, over keep-alive connections. The request
+    path is taken relative to the folder, so a single server can stand in for several judges, one per subfolder.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = HTTP_TIMEOUT
+
+    def file_path(self):
+        parts = [part for part in unquote(urlsplit(self.path).path).split('/') if part]
+        if not parts or any(part.startswith('.') for part in parts):  # no hidden files or parent folders
+            self.send_error(400, "Invalid file name")
+            return None
+        return os.path.join(self.server.folder, *parts)
+
+    def do_GET(self):
+        path = self.file_path()
+        if path is None:
+            return
+        try:
+            file = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            self.send_empty_response(404)
+            return
+        with file:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(os.fstat(file.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(file, self.wfile, BUFFER_SIZE)
+
+    def do_PUT(self):
+        path = self.file_path()
+        if path is None:
+            return
+        if 'Content-Length' not in self.headers:
+            self.send_error(411)
+            return
+        remaining = int(self.headers['Content-Length'])
+        make_from_full_package.ensure_dir_exists(os.path.dirname(path))
+        descriptor, staging = tempfile.mkstemp(dir=self.server.folder, prefix='.' + os.path.basename(path))
+        try:
+            with os.fdopen(descriptor, 'wb') as staging_file:
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, BUFFER_SIZE))
+                    if not chunk:
+                        raise ConnectionResetError("request body cut short")
+                    staging_file.write(chunk)
+                    remaining -= len(chunk)
+            os.chmod(staging, 0o644)
+            os.replace(staging, path)
+        except BaseException:
+            os.remove(staging)
+            raise
+        self.send_empty_response(201)
+
+    def send_empty_response(self, code):
+        """Answers without a body, keeping the connection open, unlike send_error."""
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(folder, host='127.0.0.1', port=DEFAULT_PORT):
+    """Runs the stand-in judge endpoint on folder until interrupted."""
+    make_from_full_package.ensure_dir_exists(folder)
+    server = ThreadingHTTPServer((host, port), PackageRequestHandler)
+    server.folder = os.path.abspath(folder)
+    print(f"Serving {server.folder} on http://{host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    """
+    Sends the packages in zip_packages to judges and shared folders, only where their manifest changed.
+
+    Usage: python3 publish.py --target FOLDER|URL [--target FOLDER|URL]... [--connections N] [--force] [LETTER...]
+           python3 publish.py --serve FOLDER [--host HOST] [--port PORT]
+
+    A URL target receives each package as a PUT request to the URL followed by Problem_<letter>.zip, with its
+    manifest next to it. --serve runs a stand-in for such a target that stores the files in FOLDER.
+    """
+    args = sys.argv[1:]
+    destination_list = []
+    try:
+        serve_folder = make_from_full_package.pop_option(args, '--serve', str)
+        serve_host = make_from_full_package.pop_option(args, '--host', str)
+        serve_port = make_from_full_package.pop_option(args, '--port', int)
+        connection_count = make_from_full_package.pop_option(args, '--connections', int)
+        destination = make_from_full_package.pop_option(args, '--target', str)
+        while destination is not None:
+            destination_list.append(destination)
+            destination = make_from_full_package.pop_option(args, '--target', str)
+    except ValueError as e:
+        sys.exit(f"Invalid option: {e}")
+    if serve_folder is not None:
+        serve(serve_folder, serve_host or '127.0.0.1', DEFAULT_PORT if serve_port is None else serve_port)
+        sys.exit(0)
+
+    force_upload = '--force' in args
+    args = [arg for arg in args if arg != '--force']
+    if not destination_list:
+        sys.exit("Usage: python3 publish.py --target FOLDER|URL [--target FOLDER|URL]... [--connections N] [--force] "
+                 "[LETTER...]\n       python3 publish.py --serve FOLDER [--host HOST] [--port PORT]")
+    try:
+        publish_reports = publish_packages(destination_list, args or None,
+                                           DEFAULT_CONNECTIONS if connection_count is None else connection_count,
+                                           force_upload)
+    except PackageError as e:
+        print("Error:", e)
+        sys.exit(1)
+    print_report(publish_reports)
+    sys.exit(1 if any(report['failed'] for report in publish_reports) else 0)
@@ -0,0 +1,330 @@
+/*
+ * fastcmp: single-pass replacement for the diff ladder of the BOCA compare scripts.
+ *
+ * Usage: fastcmp team_output sol_output
+ *
+ * Both files are mapped in memory once and compared with the same normalizations the compare scripts try with diff,
+ * from the strictest to the most lenient, all in a single pass:
+ *
+ *   diff             exact match                                                  exit 4
+ *   diff -b          ignore changes in the amount of white space                  exit 5
+ *   diff -b -B       ... and blank lines                                          exit 5
+ *   diff -i -b -B    ... and case                                                 exit 5
+ *   diff -b -B -w    ignore all white space and blank lines                       exit 5
+ *   diff -i -b -B -w ... and case                                                 exit 5
+ *   otherwise        differences found                                            exit 6
+ *
+ * Each normalization has its own position in both files, and all of them advance together, one line per round, so
+ * every line is read once while it is still in cache; a normalization is dropped at its first difference, and the
+ * comparison stops as soon as the strictest one left reaches the end of both files. Where the scripts print the
+ * diff -c output of the strictest normalization that failed, fastcmp prints its first differing lines.
+ *
+ * The messages are the ones the scripts print, and BOCA shows the last line to the judges. The wdiff step of the
+ * scripts is not reproduced: its arguments are quoted literally, so it never matches.
+ *
+ * With -B, blank lines are skipped before the lines are compared. diff instead ignores blank lines only in hunks
+ * made of blank lines alone, so in rare cases where it aligns a blank line against a non-blank one it reports a
+ * difference that fastcmp does not.
+ */
+#define _GNU_SOURCE
+#include <ctype.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+enum {
+    IGNORE_SPACE_CHANGE = 1,
+    IGNORE_BLANK_LINES = 2,
+    IGNORE_CASE = 4,
+    IGNORE_ALL_SPACE = 8
+};
+
+/* Longest part of a differing line printed */
+#define EXCERPT_LENGTH 200
+
+/* Bytes the exact comparison checks at once while the files are identical */
+#define BLOCK_SIZE 65536
+
+typedef struct {
+    const unsigned char *start;
+    const unsigned char *end;
+} text;
+
+enum {
+    ACTIVE,
+    MATCHED,
+    FAILED
+};
+
+/* Position of one normalization in both files, and its first difference once it failed */
+typedef struct {
+    int flags;
+    int state;
+    const unsigned char *a, *b;
+    long line_a, line_b;
+    const unsigned char *diff_a, *diff_a_end, *diff_b, *diff_b_end;
+} cursor;
+
+/* White space as diff sees it inside a line */
+static int is_space(int c) {
+    return c == ' ' || c == '\t' || c == '\v' || c == '\f' || c == '\r';
+}
+
+/* Maps the whole file in memory, returning 0 on failure */
+static int map_file(const char *path, text *file) {
+    struct stat st;
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) {
+        return 0;
+    }
+    if (fstat(fd, &st) < 0) {
+        close(fd);
+        return 0;
+    }
+    file->start = (const unsigned char *) "";
+    if (st.st_size > 0) {
+        void *data = mmap(NULL, (size_t) st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        if (data == MAP_FAILED) {
+            close(fd);
+            return 0;
+        }
+        madvise(data, (size_t) st.st_size, MADV_SEQUENTIAL);
+        file->start = data;
+    }
+    file->end = file->start + st.st_size;
+    close(fd);
+    return 1;
+}
+
+static const unsigned char *line_end(const unsigned char *p, const unsigned char *end) {
+    const unsigned char *newline = memchr(p, '\n', (size_t) (end - p));
+    return newline ? newline : end;
+}
+
+static const unsigned char *next_line(const unsigned char *line_end, const unsigned char *end) {
+    return line_end < end ? line_end + 1 : end;
+}
+
+static int is_blank_line(const unsigned char *p, const unsigned char *end) {
+    for (; p < end; p++) {
+        if (!is_space(*p)) {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+static int lines_equal(const unsigned char *a, const unsigned char *a_end,
+                       const unsigned char *b, const unsigned char *b_end, int flags) {
+    for (;;) {
+        if (flags & (IGNORE_SPACE_CHANGE | IGNORE_ALL_SPACE)) {
+            int a_space = a < a_end && is_space(*a);
+            int b_space = b < b_end && is_space(*b);
+            while (a < a_end && is_space(*a)) {
+                a++;
+            }
+            while (b < b_end && is_space(*b)) {
+                b++;
+            }
+            /* A run of white space only matches another run, or the end of the other line when it is trailing */
+            if (!(flags & IGNORE_ALL_SPACE) && a_space != b_space) {
+                return a == a_end && b == b_end;
+            }
+        }
+        if (a == a_end || b == b_end) {
+            return a == a_end && b == b_end;
+        }
+        int ca = *a++, cb = *b++;
+        if (flags & IGNORE_CASE) {
+            ca = tolower(ca);
+            cb = tolower(cb);
+        }
+        if (ca != cb) {
+            return 0;
+        }
+    }
+}
+
+/* Skips the blank lines at *p, counting them in *line */
+static const unsigned char *skip_blank_lines(const unsigned char *p, const unsigned char *end, long *line) {
+    while (p < end) {
+        const unsigned char *e = line_end(p, end);
+        if (!is_blank_line(p, e)) {
+            break;
+        }
+        p = next_line(e, end);
+        (*line)++;
+    }
+    return p;
+}
+
+/* Records the lines a normalization failed at; a NULL line is the end of its file */
+static void fail(cursor *c, const unsigned char *a, const unsigned char *a_end,
+                 const unsigned char *b, const unsigned char *b_end) {
+    c->state = FAILED;
+    c->diff_a = a;
+    c->diff_a_end = a_end;
+    c->diff_b = b;
+    c->diff_b_end = b_end;
+}
+
+/* Counts the line breaks between p and end */
+static long count_lines(const unsigned char *p, const unsigned char *end) {
+    long lines = 0;
+    while ((p = memchr(p, '\n', (size_t) (end - p))) != NULL) {
+        lines++;
+        p++;
+    }
+    return lines;
+}
+
+/* Advances the exact comparison over the next block when it is identical in both files, up to its last line break */
+static int skip_identical_block(cursor *c, text a, text b) {
+    if (a.end - c->a < BLOCK_SIZE || b.end - c->b < BLOCK_SIZE || memcmp(c->a, c->b, BLOCK_SIZE) != 0) {
+        return 0;
+    }
+    const unsigned char *last = memrchr(c->a, '\n', BLOCK_SIZE);
+    if (last == NULL) {
+        return 0;
+    }
+    long lines = count_lines(c->a, last + 1);
+    c->b += last + 1 - c->a;
+    c->a = last + 1;
+    c->line_a += lines;
+    c->line_b += lines;
+    return 1;
+}
+
+/* Compares the next line of both files under the normalization of c */
+static void step(cursor *c, text a, text b) {
+    if (!c->flags && skip_identical_block(c, a, b)) {
+        return;
+    }
+    if (c->flags & IGNORE_BLANK_LINES) {
+        c->a = skip_blank_lines(c->a, a.end, &c->line_a);
+        c->b = skip_blank_lines(c->b, b.end, &c->line_b);
+    }
+    if (c->a == a.end || c->b == b.end) {
+        if (c->a == a.end && c->b == b.end) {
+            c->state = MATCHED;
+        } else if (c->a == a.end) {
+            fail(c, NULL, NULL, c->b, line_end(c->b, b.end));
+        } else {
+            fail(c, c->a, line_end(c->a, a.end), NULL, NULL);
+        }
+        return;
+    }
+    const unsigned char *ea = line_end(c->a, a.end), *eb = line_end(c->b, b.end);
+    const unsigned char *na = next_line(ea, a.end), *nb = next_line(eb, b.end);
+    int equal;
+    if (c->flags) {
+        equal = lines_equal(c->a, ea, c->b, eb, c->flags);
+    } else {
+        /* An exact match also needs the same line ending, or lack of one at the end of the file */
+        equal = na - c->a == nb - c->b && memcmp(c->a, c->b, (size_t) (na - c->a)) == 0;
+    }
+    if (!equal) {
+        fail(c, c->a, ea, c->b, eb);
+        return;
+    }
+    c->a = na;
+    c->b = nb;
+    c->line_a++;
+    c->line_b++;
+}
+
+static void print_line(char marker, const unsigned char *p, const unsigned char *end) {
+    if (p == NULL) {
+        printf("%c (end of file)\n", marker);
+        return;
+    }
+    size_t length = (size_t) (end - p);
+    printf("%c ", marker);
+    fwrite(p, 1, length > EXCERPT_LENGTH ? EXCERPT_LENGTH : length, stdout);
+    printf("%s\n", length > EXCERPT_LENGTH ? "..." : "");
+}
+
+/* Prints the first lines where a normalization found the files different */
+static void print_difference(const cursor *c) {
+    printf("first difference at line %ld of the team output and line %ld of the solution:\n", c->line_a + 1,
+           c->line_b + 1);
+    print_line('<', c->diff_a, c->diff_a_end);
+    print_line('>', c->diff_b, c->diff_b_end);
+}
+
+int main(int argc, char **argv) {
+    static const struct {
+        int flags;
+        const char *options;
+        const char *message;
+    } ladder[] = {
+        {0, "", "Files match exactly"},
+        {IGNORE_SPACE_CHANGE, " -b", "Files match with differences in the amount of white spaces"},
+        {IGNORE_SPACE_CHANGE | IGNORE_BLANK_LINES, " -b -B",
+         "Files match with differences in the amount of white spaces and blank lines"},
+        {IGNORE_SPACE_CHANGE | IGNORE_BLANK_LINES | IGNORE_CASE, " -i -b -B",
+         "Files match if we ignore case and differences in the amount of white spaces and blank lines"},
+        {IGNORE_SPACE_CHANGE | IGNORE_BLANK_LINES | IGNORE_ALL_SPACE, " -b -B -w",
+         "Files match if we discard all white spaces"},
+        {IGNORE_SPACE_CHANGE | IGNORE_BLANK_LINES | IGNORE_CASE | IGNORE_ALL_SPACE, " -i -b -B -w",
+         "Files match if we ignore case and discard all white spaces"},
+    };
+    enum { LEVELS = sizeof(ladder) / sizeof(ladder[0]) };
+    text team, solution;
+    cursor cursors[LEVELS];
+
+    if (argc < 3 || !map_file(argv[1], &team) || !map_file(argv[2], &solution)) {
+        printf("Parameter problem\n");
+        return 43;
+    }
+    for (int i = 0; i < LEVELS; i++) {
+        cursors[i] = (cursor) {ladder[i].flags, ACTIVE, team.start, solution.start, 0, 0, NULL, NULL, NULL, NULL};
+    }
+    for (;;) {
+        int first = 0;
+        while (first < LEVELS && cursors[first].state == FAILED) {
+            first++;
+        }
+        if (first == LEVELS) {
+            break;
+        }
+        if (cursors[first].state == MATCHED) {
+            printf("diff%s \"%s\" \"%s\" # files match\n", ladder[first].options, argv[1], argv[2]);
+            if (first > 0) {
+                printf("diff%s \"%s\" \"%s\" # files dont match - see output\n", ladder[first - 1].options, argv[1],
+                       argv[2]);
+                print_difference(&cursors[first - 1]);
+            }
+            printf("%s\n", ladder[first].message);
+            return first == 0 ? 4 : 5;
+        }
+        /* Text that is identical in both files matches under every normalization and leaves them at the same lines,
+           so the levels still at the position of the exact one follow it without comparing again */
+        cursor exact = cursors[0];
+        if (exact.state == ACTIVE) {
+            step(&cursors[0], team, solution);
+        }
+        int follow = exact.state == ACTIVE && cursors[0].state == ACTIVE;
+        for (int i = first > 0 ? first : 1; i < LEVELS; i++) {
+            if (cursors[i].state != ACTIVE) {
+                continue;
+            }
+            if (follow && cursors[i].a == exact.a && cursors[i].b == exact.b) {
+                cursors[i].a = cursors[0].a;
+                cursors[i].b = cursors[0].b;
+                cursors[i].line_a = cursors[0].line_a;
+                cursors[i].line_b = cursors[0].line_b;
+            } else {
+                step(&cursors[i], team, solution);
+            }
+        }
+    }
+    printf("### files dont match - see output\n");
+    print_difference(&cursors[LEVELS - 1]);
+    printf("Differences found\n");
+    return 6;
+}